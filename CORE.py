@@ -8,76 +8,115 @@
 # 📡 ADS-B BACKEND: DIAGNOSTIC MODE
 # ==============================================================================
 import numpy as np
+import os
 import time
 import math
 import sys
+import traceback
 import socket
-import json
-from rtlsdr import RtlSdr
+import bisect
+import heapq
+import queue
+import threading
+import argparse
+import http.server
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque, OrderedDict
+
+import netio
+import protocol
 
 # --- רשת ---
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+publisher = protocol.Encoder()
 
 REF_LAT = 31.999
 REF_LON = 34.946
 
 # --- חומרה ---
-try:
-    if 'sdr' in globals():
-        try: sdr.close(); del sdr
-        except: pass
-    sdr = RtlSdr()
-    sdr.sample_rate = 2e6
-    sdr.center_freq = 1090e6
-    sdr.freq_correction = 1
-    sdr.gain = 49.6
-    print("✅ SDR Connected.")
-except:
-    print("❌ SDR Error."); sys.exit(1)
+SAMPLE_RATE = 2e6
+CENTER_FREQ = 1090e6
+FREQ_CORRECTION = 1
+SDR_GAIN = 49.6
 
 # --- פענוח (הקוד שלך) ---
-def bits_to_int(bits):
-    v = 0
-    for b in bits: v = (v << 1) | int(b)
-    return v
-
-def modes_checksum(data_bits):
-    poly = [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1]
-    bits = list(data_bits)
-    for i in range(len(bits) - 24):
-        if bits[i] == 1:
-            for j in range(len(poly)): bits[i+j] ^= poly[j]
-    return bits_to_int(bits[-24:])
-
-def decode_callsign(data_bits):
-    chars = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ#####_###############0123456789######"
-    me = data_bits[32:88]
-    cs_bits = me[8:56]
-    res = []
-    for i in range(8):
-        val = bits_to_int(cs_bits[i*6:(i+1)*6])
-        res.append(chars[val] if val < len(chars) else ' ')
-    return "".join(res).strip().replace("#", "").replace("_", "")
-
-def decode_alt(data_bits):
-    bits = data_bits[40:52]
-    q_bit = bits[8]
-    if q_bit == 0: return None
-    val = bits_to_int(bits[:8] + bits[9:])
-    alt_ft = val * 25
+# המסגרת כמספר שלם אחד של 112 ביט; כל שדה = הזזה + מסכה.
+# ME (56 ביט) = msg >> 24; בתוך ה-ME: TC בביטים 55-51 (הביט ה-0 הוא ה-LSB)
+ICAO_SHIFT = 80
+ME_SHIFT = 24
+ME_MASK = (1 << 56) - 1
+
+def frame_to_int(frame):
+    return int.from_bytes(bytes(frame), 'big')
+
+# CRC-24 של Mode-S מבוסס טבלה, בייט אחרי בייט על מסגרות ארוזות (14 או 7 בתים)
+MODES_POLY = 0xFFF409
+
+def build_crc_table():
+    table = np.zeros(256, dtype=np.uint32)
+    for b in range(256):
+        c = b << 16
+        for _ in range(8): c = ((c << 1) ^ MODES_POLY) if c & 0x800000 else c << 1
+        table[b] = c & 0xFFFFFF
+    return table
+
+CRC_TABLE = build_crc_table()
+CRC_TABLE_LIST = CRC_TABLE.tolist()
+
+def modes_checksum(frame):
+    crc = 0
+    for b in bytes(frame[:-3]): crc = ((crc << 8) & 0xFFFFFF) ^ CRC_TABLE_LIST[(crc >> 16) ^ b]
+    return crc ^ int.from_bytes(bytes(frame[-3:]), 'big')
+
+def modes_checksum_batch(frames):
+    # syndrome לכל שורה במערך N x 14 (0 = מסגרת תקינה)
+    crc = np.zeros(len(frames), dtype=np.uint32)
+    for i in range(frames.shape[1] - 3):
+        crc = ((crc << 8) & 0xFFFFFF) ^ CRC_TABLE[(crc >> 16) ^ frames[:, i]]
+    parity = frames[:, -3:].astype(np.uint32)
+    return crc ^ ((parity[:, 0] << 16) | (parity[:, 1] << 8) | parity[:, 2])
+
+# 8 תווים של 6 ביט = 4 חיפושים בטבלה של זוגות תווים (12 ביט)
+CALLSIGN_CHARS = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ#####_###############0123456789######"
+CALLSIGN_PAIRS = [a + b for a in CALLSIGN_CHARS for b in CALLSIGN_CHARS]
+
+def decode_callsign(me):
+    p = CALLSIGN_PAIRS
+    cs = p[(me >> 36) & 0xFFF] + p[(me >> 24) & 0xFFF] + p[(me >> 12) & 0xFFF] + p[me & 0xFFF]
+    return cs.strip().replace("#", "").replace("_", "")
+
+def decode_alt(me):
+    # 12 ביט גובה, Q-bit באמצע (1 = צעדים של 25 רגל)
+    alt = (me >> 36) & 0xFFF
+    if not alt & 0x10: return None
+    alt_ft = (((alt >> 5) << 4) | (alt & 0xF)) * 25 - 1000
+    return int(alt_ft * 0.3048)
+
+# שדות 13 ביט של תשובות מעקב (ביטים 20-32): C1 A1 C2 A2 C4 A4 M/X B1 Q/D1 B2 D2 B4 D4
+def decode_ac13(code):
+    # רק קידוד של 25 רגל (M=0, Q=1); Gillham לא נתמך
+    if code & 0x40 or not code & 0x10: return None
+    alt_ft = (((code >> 7) << 5) | (((code >> 5) & 1) << 4) | (code & 0xF)) * 25 - 1000
     return int(alt_ft * 0.3048)
 
-def decode_velocity_and_heading(data_bits):
-    me = data_bits[32:88]
-    subtype = bits_to_int(me[5:8])
+def decode_id13(code):
+    a = ((code >> 7) & 1) << 2 | ((code >> 9) & 1) << 1 | ((code >> 11) & 1)
+    b = ((code >> 1) & 1) << 2 | ((code >> 3) & 1) << 1 | ((code >> 5) & 1)
+    c = ((code >> 8) & 1) << 2 | ((code >> 10) & 1) << 1 | ((code >> 12) & 1)
+    d = (code & 1) << 2 | ((code >> 2) & 1) << 1 | ((code >> 4) & 1)
+    return f"{a}{b}{c}{d}"
+
+def decode_velocity_and_heading(me):
+    subtype = (me >> 48) & 0x7
     if subtype in (1, 2):
-        v_ew_raw = bits_to_int(me[14:24])
-        v_ns_raw = bits_to_int(me[25:35])
+        v_ew_raw = (me >> 32) & 0x3FF
+        v_ns_raw = (me >> 21) & 0x3FF
         if v_ew_raw and v_ns_raw:
-            v_ew = (v_ew_raw - 1) * (-1 if me[13] else 1)
-            v_ns = (v_ns_raw - 1) * (-1 if me[24] else 1)
+            v_ew = (v_ew_raw - 1) * (-1 if (me >> 42) & 1 else 1)
+            v_ns = (v_ns_raw - 1) * (-1 if (me >> 31) & 1 else 1)
             speed_kts = math.sqrt(v_ew**2 + v_ns**2)
             speed_kmh = int(speed_kts * 1.852)
             heading_deg = math.degrees(math.atan2(v_ew, v_ns))
@@ -87,104 +126,965 @@ def decode_velocity_and_heading(data_bits):
 
 def cpr_mod(a, b): res = a % b; return res if res >= 0 else res + b
 
-def decode_cpr_local(lat_raw, lon_raw, is_odd):
+# --- CPR ---
+# NL (מספר אזורי האורך) יורד ב-1 בכל אחת מ-58 קווי רוחב קבועים; מחשבים אותם פעם אחת
+# ואז NL של מיקום = חיפוש בינארי בטבלה במקום acos/cos לכל הודעה
+def build_nl_table():
+    a = 1 - math.cos(math.pi / 30.0)
+    return [math.degrees(math.acos(math.sqrt(a / (1 - math.cos(2 * math.pi / nl))))) for nl in range(59, 1, -1)]
+
+NL_TABLE = build_nl_table()
+
+def cpr_nl(lat):
+    return 59 - bisect.bisect_right(NL_TABLE, abs(lat))
+
+def decode_cpr_local(lat_raw, lon_raw, is_odd, ref_lat=REF_LAT, ref_lon=REF_LON):
+    # פענוח מהודעה אחת יחסית לנקודת ייחוס (תקף עד חצי אזור, ~180 NM, מהייחוס)
     dlat = 360.0 / (59.0 if is_odd else 60.0)
-    j = math.floor(REF_LAT / dlat) + math.floor(0.5 + cpr_mod(REF_LAT, dlat) / dlat - lat_raw / 131072.0)
+    j = math.floor(ref_lat / dlat) + math.floor(0.5 + cpr_mod(ref_lat, dlat) / dlat - lat_raw / 131072.0)
     lat_res = dlat * (j + lat_raw / 131072.0)
-    try:
-        numerator = 1 - math.cos(math.pi / 30.0)
-        denominator = (math.cos(math.pi / 180.0 * lat_res)) ** 2 - numerator
-        nl = math.floor(2 * math.pi / math.acos(1 - numerator/denominator)) if denominator > 0 else 1
-    except: nl = 1
-    nl = max(nl, 1)
-    dlon = 360.0 / max(nl - (1 if is_odd else 0), 1)
+    dlon = 360.0 / max(cpr_nl(lat_res) - (1 if is_odd else 0), 1)
     lon_base = (lon_raw / 131072.0) * dlon
-    closest_offset = round((REF_LON - lon_base) / dlon) * dlon
+    closest_offset = round((ref_lon - lon_base) / dlon) * dlon
     lon_res = lon_base + closest_offset
     return round(lat_res, 5), round(lon_res, 5)
 
+def decode_cpr_global(even, odd, odd_is_latest):
+    # פענוח חד-משמעי מזוג even/odd, בלי נקודת ייחוס. None אם הזוג חוצה גבול NL
+    lat0, lon0 = even[0] / 131072.0, even[1] / 131072.0
+    lat1, lon1 = odd[0] / 131072.0, odd[1] / 131072.0
+    j = math.floor(59 * lat0 - 60 * lat1 + 0.5)
+    rlat0 = 6.0 * (cpr_mod(j, 60) + lat0)
+    rlat1 = 360.0 / 59 * (cpr_mod(j, 59) + lat1)
+    if rlat0 >= 270: rlat0 -= 360
+    if rlat1 >= 270: rlat1 -= 360
+    nl = cpr_nl(rlat0)
+    if nl != cpr_nl(rlat1): return None
+    m = math.floor(lon0 * (nl - 1) - lon1 * nl + 0.5)
+    if odd_is_latest:
+        ni = max(nl - 1, 1)
+        lat, lon = rlat1, 360.0 / ni * (cpr_mod(m, ni) + lon1)
+    else:
+        ni = max(nl, 1)
+        lat, lon = rlat0, 360.0 / ni * (cpr_mod(m, ni) + lon0)
+    if lon >= 180: lon -= 360
+    return round(lat, 5), round(lon, 5)
+
+# זוג even/odd נחשב טרי אם שתי ההודעות התקבלו בטווח של CPR_PAIR_WINDOW שניות
+CPR_PAIR_WINDOW = 10.0
+
+def decode_position(ac, lat_raw, lon_raw, is_odd, now):
+    # גלובלי כשיש זוג טרי, אחרת מקומי יחסית למיקום האחרון של המטוס; None עד שיש אחד מהם
+    if is_odd: ac.cpr_odd = (lat_raw, lon_raw, now)
+    else: ac.cpr_even = (lat_raw, lon_raw, now)
+    even, odd = ac.cpr_even, ac.cpr_odd
+    if even and odd and abs(even[2] - odd[2]) <= CPR_PAIR_WINDOW:
+        pos = decode_cpr_global(even, odd, is_odd)
+        if pos: return pos
+    if ac.lat is not None:
+        return decode_cpr_local(lat_raw, lon_raw, is_odd, ac.lat, ac.lon)
+    return None
+
+# --- בדיקת סבירות למיקום ---
+# זוג even/odd שגוי (ממשטח אחר, או ממטוס אחר אחרי שחזור AP) נותן מיקום פרוע שנראה תקין.
+# נדחה: מיקום לא חוקי, או קפיצה מהמיקום הקודם שמהירה מ-MAX_FIX_SPEED_KMH.
+# אחרי FIX_MAX_REJECTS דחיות רצופות המיקום החדש מתקבל - כנראה שהקודם הוא השגוי.
+# אין בדיקת טווח מול REF_LAT/REF_LON: המיקום כבר מפוענח גלובלית, והבדיקה הייתה קושרת אותו שוב לנקודה הקבועה.
+MAX_FIX_SPEED_KMH = 2000
+FIX_JUMP_SLACK_KM = 2.0
+FIX_MAX_REJECTS = 3
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # קירוב equirectangular - מספיק לבדיקת סבירות
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return 6371.0 * math.hypot(x, math.radians(lat2 - lat1))
+
+def plausible_fix(ac, pos, now):
+    lat, lon = pos
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        stats['pos_rejected'] += 1
+        return False
+    if ac.lat is not None and ac.rejects < FIX_MAX_REJECTS:
+        limit = FIX_JUMP_SLACK_KM + MAX_FIX_SPEED_KMH * (now - ac.fix) / 3600
+        if distance_km(ac.lat, ac.lon, lat, lon) > limit:
+            ac.rejects += 1
+            stats['pos_rejected'] += 1
+            return False
+    ac.rejects = 0
+    return True
+
+# --- תיקון שגיאות לפי syndrome ---
+# ה-CRC לינארי: syndrome של שגיאה בביט i שווה ל-syndrome של מסגרת שרק ביט i דולק בה,
+# ושל שגיאה כפולה - XOR של שניהם. בנייה חד-פעמית, ואז תיקון = חיפוש אחד במילון.
+# ביטי ה-DF (0-4) לא מתוקנים כדי שמסגרת לא תהפוך לפורמט אחר.
+FIX_TWO_BITS = False
+
+def build_syndrome_index(nbits=112, two_bits=FIX_TWO_BITS):
+    unit = np.packbits(np.eye(nbits, dtype=np.uint8), axis=1)
+    syn = modes_checksum_batch(unit).tolist()
+    index = {syn[i]: (i,) for i in range(5, nbits)}
+    if two_bits:
+        pairs, ambiguous = {}, set()
+        for i in range(5, nbits):
+            for j in range(i + 1, nbits):
+                s = syn[i] ^ syn[j]
+                if s in index: continue
+                if s in pairs: ambiguous.add(s)
+                pairs[s] = (i, j)
+        for s in ambiguous: del pairs[s]
+        index.update(pairs)
+    return index
+
+SYNDROME_INDEX = build_syndrome_index()
+stats = {'crc_ok': 0, 'crc_fixed1': 0, 'crc_fixed2': 0, 'crc_bad': 0, 'df11': 0, 'ap_ok': 0, 'ap_bad': 0, 'dup_hit': 0, 'dup_miss': 0, 'blocks': 0, 'candidates': 0,
+         'pub_updates': 0, 'pub_datagrams': 0, 'pub_bytes': 0, 'worker_errors': 0,
+         'pos_rejected': 0}
+
+def fix_frames(frames, syndromes):
+    # מתקן את המסגרות במקום ומחזיר מסכה של המסגרות התקינות אחרי התיקון
+    valid = syndromes == 0
+    stats['crc_ok'] += int(valid.sum())
+    for k in np.flatnonzero(~valid):
+        err = SYNDROME_INDEX.get(int(syndromes[k]))
+        if err is None:
+            stats['crc_bad'] += 1
+            continue
+        for i in err: frames[k, i >> 3] ^= 0x80 >> (i & 7)
+        stats['crc_fixed%d' % len(err)] += 1
+        valid[k] = True
+    return valid
+
+# --- גילוי preamble (וקטורי) ---
+# 2 MSPS: דגימה = 0.5 µs. פולסים ב-0, 1, 3.5, 4.5 µs -> דגימות 0, 2, 7, 9; הביטים מתחילים בדגימה 16
+FRAME_SAMPLES = 16 + 2 * 112
+PREAMBLE_WINDOW = np.arange(16)
+THRESH_FACTOR = 6.0
+
+# --- רצפת רעש מתגלגלת ---
+# במקום ממוצע אחד על כל הבלוק (שמשדר חזק קרוב מושך למעלה), הבלוק מחולק לחלונות של NOISE_WINDOW
+# דגימות, ולכל חלון נלקח האחוזון ה-NOISE_PERCENTILE מתוך דגימה אחת מכל NOISE_DECIM.
+# האחוזון הנמוך כמעט לא מושפע מהמסגרות עצמן; level הוא ממוצע נע של הרצפה בין בלוקים,
+# ומשמש כחסם תחתון לחלונות ריקים (אפסים בהקלטה וכו').
+# חישוב הרצפה עצמו זול (~0.1 ms לבלוק), אבל הסף הנמוך יותר מעביר הרבה יותר מועמדים ומסגרות:
+# בתרחיש busy של benchmark.py התפוקה ירדה מ-~137 ל-~13 MSPS (ה-yield עלה מ-0.7% ל-76%) -
+# עדיין פי 6 מעל 2 MSPS בזמן אמת, ואפשר לחלק את העבודה עם --workers.
+NOISE_WINDOW = 4096
+NOISE_DECIM = 16
+NOISE_PERCENTILE = 25
+NOISE_ALPHA = 0.1
+NOISE_MIN_RATIO = 0.5
+
+class NoiseFloor:
+    def __init__(self):
+        self.level = None
+        self.block = None  # החציון של הבלוק האחרון
+
+    def reset(self):
+        self.level = self.block = None
+
+    def update(self, mag):
+        # מחזיר רצפה לכל חלון (float32); זנב חלקי מקבל את רצפת החלון האחרון
+        d = mag[::NOISE_DECIM]
+        per = min(NOISE_WINDOW // NOISE_DECIM, len(d))
+        full = len(d) // per
+        k = per * NOISE_PERCENTILE // 100
+        floors = np.partition(d[:full * per].reshape(full, per), k, axis=1)[:, k].astype(np.float32)
+        if full * NOISE_WINDOW < len(mag): floors = np.append(floors, floors[-1])
+
+        self.absorb(float(np.median(floors)))
+        return np.maximum(floors, self.level * NOISE_MIN_RATIO)
+
+    def absorb(self, block):
+        # EMA על חציון הבלוק. ב-pool ה-worker מקבל את הרמה של התהליך הראשי ומחזיר את החציון,
+        # והתהליך הראשי מחיל את החציונים לפי סדר הדגימות - רצפה אחת, כמו בלי workers
+        self.block = block
+        self.level = block if self.level is None else self.level + NOISE_ALPHA * (block - self.level)
+
+    def dbfs(self):
+        if not self.level: return float('-inf')
+        return 20 * math.log10(self.level / MAG_FULL_SCALE)
+
+noise = NoiseFloor()
+
+def detect_preambles(mag, thresh):
+    # thresh: סף אחד, או סף לכל חלון של NOISE_WINDOW דגימות
+    n = len(mag) - FRAME_SAMPLES + 1
+    if n <= 0: return np.empty(0, dtype=np.intp)
+    thresh = np.asarray(thresh)
+    p = np.flatnonzero(mag[:n] > thresh.min())
+    if thresh.ndim and len(p): p = p[mag[p] > thresh[p // NOISE_WINDOW]]
+    # סינון זול לפני האינדוקס הדו-ממדי: השקע בין שני הפולסים הראשונים
+    if len(p): p = p[(mag[p + 1] < mag[p]) & (mag[p + 1] < mag[p + 2])]
+    if len(p) == 0: return p
+    m = mag[p[:, None] + PREAMBLE_WINDOW].astype(np.float32)
+    ok = (m[:, 0] > m[:, 1]) & (m[:, 1] < m[:, 2]) & (m[:, 2] > m[:, 3]) & (m[:, 3] < m[:, 0])
+    ok &= (m[:, 4] < m[:, 0]) & (m[:, 5] < m[:, 0]) & (m[:, 6] < m[:, 0])
+    ok &= (m[:, 7] > m[:, 8]) & (m[:, 8] < m[:, 9]) & (m[:, 9] > m[:, 6])
+    # השקטים (2-3 µs בין זוגות הפולסים, 5.5-7.5 µs לפני הנתונים) חייבים להיות מתחת לרמת הפולסים
+    high = (m[:, 0] + m[:, 2] + m[:, 7] + m[:, 9]) / 6
+    ok &= (m[:, 4] < high) & (m[:, 5] < high) & (m[:, 11:15].max(axis=1) < high)
+    return p[ok]
+
+# --- דמודולציית PPM באצווה ---
+# כל ביט: השוואת שני חצאי החלון של 1 µs; כל המועמדים בבלוק באינדוקס דו-ממדי אחד
+BIT_OFFSETS = 16 + 2 * np.arange(112)
+
+def demod_frames(mag, offsets):
+    idx = offsets[:, None] + BIT_OFFSETS
+    return np.packbits(mag[idx] > mag[idx + 1], axis=1)
+
+# --- בחירת מסגרות תקינות: DF17, DF11 ותשובות מעקב (DF4/5/20/21) ---
+# DF17: CRC נקי (או מתוקן). DF11: ה-parity מכיל רק את קוד החוקר (7 ביטים תחתונים).
+# DF4/5/20/21: ה-parity הוא CRC XOR כתובת (Address/Parity) - ה-syndrome הוא הכתובת עצמה,
+# והמסגרת מתקבלת רק אם הכתובת נמצאת ב-known (ICAO שנשמעו לאחרונה ב-DF11/DF17).
+LONG_DF = (17, 20, 21)
+SHORT_DF = (4, 5, 11)
+LONG_SAMPLES = FRAME_SAMPLES
+SHORT_SAMPLES = 16 + 2 * 56
+
+def validate_frames(offsets, frames, known=()):
+    df = frames[:, 0] >> 3
+    is_long = np.isin(df, LONG_DF)
+    keep = is_long | np.isin(df, SHORT_DF)
+    offsets, frames, df, is_long = offsets[keep], frames[keep], df[keep], is_long[keep]
+
+    syn = np.zeros(len(frames), dtype=np.uint32)
+    syn[is_long] = modes_checksum_batch(frames[is_long])
+    syn[~is_long] = modes_checksum_batch(frames[~is_long, :7])
+
+    valid = np.zeros(len(frames), dtype=bool)
+    is17 = df == 17
+    sub = frames[is17]
+    valid[is17] = fix_frames(sub, syn[is17])
+    frames[is17] = sub
+    # AA אחרי התיקון - ביט מתוקן יכול להיות בתוך שדה הכתובת
+    aa = (frames[:, 1].astype(np.uint32) << 16) | (frames[:, 2].astype(np.uint32) << 8) | frames[:, 3]
+    is11 = df == 11
+    valid[is11] = (syn[is11] & ~np.uint32(0x7F)) == 0
+    stats['df11'] += int(valid[is11].sum())
+    addrs = np.where(is17 | is11, aa, syn)
+    ap = np.flatnonzero(~(is17 | is11))
+    hits = [a in known for a in addrs[ap].tolist()]
+    valid[ap] = hits
+    stats['ap_ok'] += sum(hits)
+    stats['ap_bad'] += len(hits) - sum(hits)
+
+    offsets, frames, is_long, addrs = offsets[valid], frames[valid], is_long[valid], addrs[valid]
+    # ביטול חפיפות: מסגרת שמתחילה בתוך מסגרת תקינה קודמת היא הד/זבל של אותה מסגרת
+    keep, last_end = [], -1
+    for k, (p, long_frame) in enumerate(zip(offsets.tolist(), is_long.tolist())):
+        if p < last_end: continue
+        keep.append(k)
+        last_end = p + (LONG_SAMPLES if long_frame else SHORT_SAMPLES)
+    return offsets[keep], frames[keep], addrs[keep]
+
+# --- מגניטודה מ-I/Q גולמי (uint8) דרך טבלה ---
+# זוג הבתים I,Q נקרא כ-uint16 (little-endian: I | Q << 8) ומשמש אינדקס לטבלה של 64K ערכים,
+# בלי המרה ל-float ובלי שורש. MAG_FULL_SCALE מחזיר את הסקאלה של read_samples (|iq| עד ~1.41)
+MAG_LUT_GAIN = 360
+MAG_FULL_SCALE = 127.5 * MAG_LUT_GAIN
+
+def build_mag_lut():
+    v = np.arange(256, dtype=np.float64) - 127.5
+    return np.round(np.sqrt(v[:, None] ** 2 + v[None, :] ** 2) * MAG_LUT_GAIN).astype(np.uint16).ravel()
+
+MAG_LUT = build_mag_lut()
+
+def iq_to_mag(iq, out=None):
+    return np.take(MAG_LUT, iq.view('<u2'), out=out)
+
+# --- לכידה ברקע: באפר טבעתי מוקצה מראש + המשכיות בין בלוקים ---
+# כל תא בטבעת מתחיל ב-CARRY הדגימות האחרונות של הבלוק הקודם, כך שמסגרת שנחתכה
+# בסוף בלוק מפוענחת בבלוק הבא (ואף מסגרת לא מפוענחת פעמיים). הטבעת שומרת בתים גולמיים (I,Q).
+BLOCK_SIZE = 256 * 1024
+RING_SLOTS = 8
+CARRY = FRAME_SAMPLES - 1
+
+# --- מקורות דגימות ---
+# כל מקור דוחף בתי I/Q גולמיים ל-callback(values, context) בבלוקים של num_bytes עד stop() או סוף הקלטה.
+# live = True: המקור לא מחכה למפענח (בלוק שאין לו מקום בטבעת נזרק ונספר כ-overrun).
+class RtlSdrSource:
+    live = True
+
+    def __init__(self, gain=SDR_GAIN):
+        from rtlsdr import RtlSdr
+        self.sdr = RtlSdr()
+        self.sdr.sample_rate = SAMPLE_RATE
+        self.sdr.center_freq = CENTER_FREQ
+        self.sdr.freq_correction = FREQ_CORRECTION
+        self.sdr.gain = gain
+
+    def stream(self, callback, num_bytes):
+        self.sdr.read_bytes_async(callback, num_bytes)
+
+    def stop(self):
+        try: self.sdr.cancel_read_async()
+        except: pass
+
+    def close(self):
+        self.sdr.close()
+
+class RecordingSource:
+    # עוטף מקור אחר וכותב את ה-I/Q הגולמי לקובץ תוך כדי פענוח
+    def __init__(self, source, path):
+        self.source = source
+        self.live = source.live
+        self.file = open(path, 'wb')
+
+    def stream(self, callback, num_bytes):
+        def on_bytes(values, context):
+            self.file.write(values)
+            callback(values, context)
+        self.source.stream(on_bytes, num_bytes)
+
+    def stop(self):
+        self.source.stop()
+
+    def close(self):
+        self.source.close()
+        self.file.close()
+
+class ReplaySource:
+    # ממפה הקלטה לזיכרון ומזין אותה כמה שהמפענח מסוגל לצרוך, או בקצב אמת עם realtime=True
+    def __init__(self, path, realtime=False):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        self.live = realtime
+        self.stopped = False
+
+    def stream(self, callback, num_bytes):
+        t0 = time.perf_counter()
+        for pos in range(0, len(self.data) - 1, num_bytes):
+            if self.stopped: return
+            if self.live:
+                delay = t0 + pos / 2 / SAMPLE_RATE - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+            callback(self.data[pos:pos + num_bytes], None)
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        del self.data
+
+class CaptureThread(threading.Thread):
+    def __init__(self, source, block_size=BLOCK_SIZE, slots=RING_SLOTS, ring=None):
+        super().__init__(daemon=True)
+        self.source = source
+        self.block_size = block_size
+        # ring חיצוני (למשל ב-shared memory) חייב להיות uint8 בצורה (slots, 2 * (CARRY + block_size))
+        self.ring = ring if ring is not None else np.zeros((slots, 2 * (CARRY + block_size)), dtype=np.uint8)
+        slots = len(self.ring)
+        self.carry = np.full(2 * CARRY, 127, dtype=np.uint8)
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        for i in range(slots): self.free.put(i)
+        self.next_sample = 0
+        self.overruns = 0
+        self.error = None
+
+    def on_bytes(self, values, context):
+        iq = np.frombuffer(values, dtype=np.uint8)
+        n = len(iq) // 2
+        try: slot = self.free.get(block=not self.source.live)
+        except queue.Empty:
+            # הפענוח לא עומד בקצב - הבלוק נזרק והרצף נשבר, אז אין המשכיות לבלוק הבא
+            self.overruns += 1
+            self.carry[:] = 127
+            self.next_sample += n
+            return
+        buf = self.ring[slot]
+        buf[:2 * CARRY] = self.carry
+        buf[2 * CARRY:2 * (CARRY + n)] = iq[:2 * n]
+        self.carry[:] = buf[2 * n:2 * (CARRY + n)]
+        self.ready.put((slot, self.next_sample - CARRY, n))
+        self.next_sample += n
+
+    def run(self):
+        try: self.source.stream(self.on_bytes, 2 * self.block_size)
+        except Exception as e: self.error = e
+
+    def get(self, timeout=1.0):
+        # מחזיר (תא, בתי I/Q כולל ה-carry, אינדקס הדגימה המוחלט של הדגימה הראשונה)
+        slot, start, n = self.ready.get(timeout=timeout)
+        return slot, self.ring[slot, :2 * (CARRY + n)], start
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def stop(self):
+        self.source.stop()
+
+# --- זמן מצטבר לכל שלב (שניות) ---
+# נמדד סביב כל שלב פעם אחת לבלוק (לא לכל מסגרת), כך שהעלות זניחה ואפשר להשאיר את זה דלוק
+STAGES = ('capture_wait', 'mag', 'detect', 'demod', 'crc', 'decode', 'publish')
+timings = dict.fromkeys(STAGES, 0.0)
+
+# --- פענוח בלוק שלם ---
+# רצפת רעש -> גילוי -> דמודולציה -> CRC/תיקון -> ביטול חפיפות; רץ בתהליך הראשי או בתהליכי ה-pool
+def decode_block(mag, known=()):
+    t0 = time.perf_counter()
+    thresh = noise.update(mag) * THRESH_FACTOR
+    offsets = detect_preambles(mag, thresh)
+    t1 = time.perf_counter()
+    frames = demod_frames(mag, offsets)
+    t2 = time.perf_counter()
+    stats['blocks'] += 1
+    stats['candidates'] += len(offsets)
+    offsets, frames, addrs = validate_frames(offsets, frames, known)
+    rssi = mag[offsets[:, None] + np.arange(200)].mean(axis=1) / MAG_FULL_SCALE
+    timings['detect'] += t1 - t0
+    timings['demod'] += t2 - t1
+    timings['crc'] += time.perf_counter() - t2
+    return offsets, frames, rssi, addrs
+
+# --- מסגרות מוכנות מהרשת (--ingest) ---
+# בלי גילוי ודמודולציה: המסגרות נכנסות ישר ל-CRC/AP. ה-offsets מדומים ורחוקים זה מזה
+# כדי שביטול החפיפות של validate_frames לא יפיל מסגרות עוקבות.
+def ingest_batch(batch, known=()):
+    t = time.perf_counter()
+    frames = np.frombuffer(b''.join(msg.ljust(14, b'\0') for msg, signal in batch), dtype=np.uint8).reshape(-1, 14).copy()
+    signal = np.fromiter((signal for msg, signal in batch), dtype=np.float32, count=len(batch))
+    offsets = np.arange(len(batch)) * LONG_SAMPLES
+    offsets, frames, addrs = validate_frames(offsets, frames, known)
+    rssi = signal[offsets // LONG_SAMPLES] / 255
+    timings['crc'] += time.perf_counter() - t
+    return offsets, frames, rssi, addrs
+
+# --- pool של תהליכי פענוח ---
+# הטבעת של ה-CaptureThread יושבת ב-shared memory; כל worker מחבר אליה לפי שם,
+# מפענח תא שלם (כולל ה-carry, כלומר בלוקים חופפים) ומחזיר מסגרות + offsets.
+# התהליך הראשי אוסף את התוצאות לפי סדר ההגשה, כך שהמאגר מתעדכן לפי סדר הדגימות.
+worker_shm = None
+worker_ring = None
+worker_mag = None
+worker_known = set()
+worker_known_version = None
+
+def pool_init(shm_name, shape):
+    global worker_shm, worker_ring, worker_mag
+    worker_shm = shared_memory.SharedMemory(name=shm_name)
+    worker_ring = np.ndarray(shape, dtype=np.uint8, buffer=worker_shm.buf)
+    worker_mag = np.empty(shape[1] // 2, dtype=np.uint16)
+
+def decode_slot(slot, n, known, version, level):
+    # known: סט המטוסים הידועים, או None אם לא השתנה מאז - אז נשאר הסט שה-worker שמר.
+    # מחזיר גם (pid, הגרסה שלפיה פוענח) כדי שהתהליך הראשי יידע מתי כל ה-workers מעודכנים.
+    global worker_known, worker_known_version
+    if known is not None: worker_known, worker_known_version = known, version
+    for k in stats: stats[k] = 0
+    for k in timings: timings[k] = 0.0
+    noise.level = level
+    t = time.perf_counter()
+    mag = iq_to_mag(worker_ring[slot, :2 * (CARRY + n)], out=worker_mag[:CARRY + n])
+    timings['mag'] += time.perf_counter() - t
+    result = decode_block(mag, worker_known)
+    return result, dict(stats), dict(timings), noise.block, (os.getpid(), worker_known_version)
+
+# --- מאגר המטוסים ---
+# רשומה קבועה לכל מטוס (slots), מפתח = ICAO כמספר. התפוגה דרך min-heap של (מועד תפוגה, ICAO):
+# רשומה אחת בערימה לכל מטוס, ואם המטוס נשמע מאז - היא נדחפת מחדש עם המועד החדש.
+# located / changed מתעדכנים תוך כדי פענוח, כך שהשידור לא סורק את כל המטוסים.
+# changed: ICAO -> זמן השינוי הראשון שעוד לא פורסם (למדידת השהיה); pub: זמן הפרסום האחרון של המטוס.
+# version: עולה בכל הוספה או מחיקה של מטוס - ה-pool שולח את סט הכתובות ל-workers רק כשהוא השתנה.
+TRACK_TIMEOUT = 60
+
+class Track:
+    __slots__ = ('addr', 'icao', 'cs', 'alt', 'spd', 'hdg', 'lat', 'lon', 'last', 'rssi', 'msgs', 'squawk', 'cpr_even', 'cpr_odd', 'pub', 'fix', 'rejects')
+
+    def __init__(self, addr, rssi, now):
+        self.addr = addr
+        self.icao = format(addr, '06X')
+        self.cs = '?'
+        self.alt = self.spd = self.hdg = 0
+        self.lat = self.lon = None
+        self.last = now
+        self.rssi = rssi
+        self.msgs = 0
+        self.squawk = None
+        self.cpr_even = self.cpr_odd = None
+        self.pub = 0.0
+        self.fix = 0.0  # זמן המיקום האחרון שהתקבל
+        self.rejects = 0
+
+    def to_dict(self):
+        return {'icao': self.icao, 'cs': self.cs, 'alt': self.alt, 'spd': self.spd, 'hdg': self.hdg,
+                'lat': self.lat, 'lon': self.lon, 'last': self.last, 'rssi': self.rssi, 'msgs': self.msgs, 'squawk': self.squawk}
+
+class TrackStore:
+    def __init__(self, timeout=TRACK_TIMEOUT):
+        self.timeout = timeout
+        self.version = 0
+        self.clear()
+
+    def clear(self):
+        self.version += 1
+        self.tracks = {}
+        self.expiry = []
+        self.located = set()
+        self.changed = {}
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def get(self, addr):
+        return self.tracks.get(addr)
+
+    def add(self, addr, rssi, now):
+        ac = self.tracks[addr] = Track(addr, rssi, now)
+        self.version += 1
+        heapq.heappush(self.expiry, (now + self.timeout, addr))
+        return ac
+
+    def expire(self, now):
+        # מחזיר את כתובות המטוסים שנמחקו
+        removed = []
+        while self.expiry and self.expiry[0][0] <= now:
+            _, addr = heapq.heappop(self.expiry)
+            ac = self.tracks[addr]
+            if ac.last + self.timeout > now:
+                heapq.heappush(self.expiry, (ac.last + self.timeout, addr))
+                continue
+            del self.tracks[addr]
+            self.located.discard(addr)
+            self.changed.pop(addr, None)
+            removed.append(addr)
+        if removed: self.version += 1
+        return removed
+
+    def pop_changed(self, now, min_interval=0.0):
+        # [(מטוס, זמן השינוי הראשון)] למטוסים עם מיקום שהשתנו; מטוס שפורסם לפני פחות
+        # מ-min_interval נשאר בתור לפעם הבאה. שינויים של מטוסים בלי מיקום נזרקים.
+        out = []
+        for a, since in list(self.changed.items()):
+            ac = self.tracks[a]
+            if a in self.located:
+                if now - ac.pub < min_interval: continue
+                ac.pub = now
+                out.append((ac, since))
+            del self.changed[a]
+        return out
+
+tracks = TrackStore()
+
+# --- מטמון כפילויות ---
+# אותה מסגרת בדיוק (אותו ערך שלם) שמגיעה שוב בתוך DEDUP_WINDOW שניות לא מגיעה למאגר.
+# OrderedDict לפי סדר ההכנסה = סדר הזמן, כך שהפינוי (פג תוקף או מעבר ל-DEDUP_SIZE) הוא מהראש.
+# חלון הזמן נמדד מההופעה הראשונה - מסגרת זהה שחוזרת באמת (למשל מהירות קבועה) עוברת פעם בחלון.
+DEDUP_WINDOW = 0.5
+DEDUP_SIZE = 8192
+
+class FrameCache:
+    def __init__(self, window=DEDUP_WINDOW, size=DEDUP_SIZE):
+        self.window = window
+        self.size = size
+        self.seen = OrderedDict()
+
+    def clear(self):
+        self.seen.clear()
+
+    def first(self, key, now):
+        # True בהופעה הראשונה בחלון
+        seen = self.seen
+        while seen and (len(seen) >= self.size or next(iter(seen.values())) + self.window <= now):
+            seen.popitem(last=False)
+        if key in seen:
+            stats['dup_hit'] += 1
+            return False
+        seen[key] = now
+        stats['dup_miss'] += 1
+        return True
+
+dedup = FrameCache()
+
+# --- עדכון המאגר ממסגרת תקינה ---
+def on_identification(ac, me):
+    ac.cs = decode_callsign(me)
+
+def on_airborne_position(ac, me):
+    pos = decode_position(ac, (me >> 17) & 0x1FFFF, me & 0x1FFFF, (me >> 34) & 1, ac.last)
+    if pos and plausible_fix(ac, pos, ac.last):
+        ac.lat, ac.lon = pos
+        ac.fix = ac.last
+        print(f"📍 LOC FIX: {ac.icao} -> {pos[0]:.4f}, {pos[1]:.4f}")
+        return True  # המסגרת הזו נתנה מיקום חדש
+
+def on_velocity(ac, me):
+    spd, hdg = decode_velocity_and_heading(me)
+    if spd:
+        ac.spd = spd
+        ac.hdg = hdg
+
+# טבלת dispatch לפי type code (0-31)
+TC_HANDLERS = [None] * 32
+for tc in range(1, 5): TC_HANDLERS[tc] = on_identification
+for tc in range(9, 19): TC_HANDLERS[tc] = on_airborne_position
+TC_HANDLERS[19] = on_velocity
+
+# מונים לכל DF ולכל type code (DF17), אחרי סינון הכפילויות
+df_counts = [0] * 32
+tc_counts = [0] * 32
+
+def handle_frame(frame, rssi, addr):
+    # addr: ה-AA של DF11/DF17, או הכתובת ששוחזרה מה-AP בתשובות מעקב
+    df = int(frame[0]) >> 3
+    now = time.time()
+    key = frame_to_int(frame if df in LONG_DF else frame[:7])
+    if not dedup.first(key, now): return
+
+    ac = tracks.get(addr)
+    if ac is None:
+        # מטוס חדש!
+        ac = tracks.add(addr, rssi, now)
+        level = f"{20 * math.log10(rssi):.1f} dBFS" if rssi > 0 else "n/a"  # rssi מנורמל ל-full scale; 0 = לא ידוע (AVR)
+        print(f"✈️ NEW ICAO: {ac.icao} (RSSI: {level})")
+
+    ac.last = now
+    ac.msgs += 1
+    df_counts[df] += 1
+
+    tc = 0
+    moved = False
+    alt = None  # הגובה שבמסגרת הזו בלבד (None אם אין או שלא פוענח)
+    if df == 17:
+        me = (key >> ME_SHIFT) & ME_MASK
+        tc = me >> 51
+        tc_counts[tc] += 1
+        handler = TC_HANDLERS[tc]
+        if handler: moved = handler(ac, me)
+        if 9 <= tc <= 18: alt = decode_alt(me)
+    elif df in (4, 20):
+        alt = decode_ac13((int(frame[2]) << 8 | int(frame[3])) & 0x1FFF)
+    elif df in (5, 21):
+        ac.squawk = decode_id13((int(frame[2]) << 8 | int(frame[3])) & 0x1FFF)
+    if alt is not None: ac.alt = alt
+    tracks.changed.setdefault(addr, now)
+    if ac.lat is not None: tracks.located.add(addr)
+    if net: emit_frame(bytes(frame[:14 if df in LONG_DF else 7]), df, tc, ac, rssi, now, moved, alt)
+
+# --- פלט לרשת: AVR (30002), SBS-1 (30003), Beast (30005) ---
+# רק מסגרות שעברו את סינון הכפילויות; כל פורמט מקודד רק אם יש לו לקוח מחובר.
+# ב-SBS הגובה ברגל והמהירות בקשרים, כמו ב-BaseStation.
+net = None
+
+def emit_frame(msg, df, tc, ac, rssi, now, moved=False, alt=None):
+    # moved: המסגרת עדכנה את המיקום - רק אז MSG,3 נושא lat/lon (אחרת זה המיקום הקודם עם חותמת זמן חדשה)
+    # alt: הגובה שפוענח מהמסגרת הזו (מטרים); None -> שדה הגובה ריק ולא הגובה הקודם או 0
+    if net.wants('avr'): net.emit('avr', netio.avr_encode(msg))
+    if net.wants('beast'): net.emit('beast', netio.beast_encode(msg, int(now * 12e6), min(int(rssi * 255), 255)))
+    if not net.wants('sbs'): return
+    alt = '' if alt is None else round(alt / 0.3048)
+    if df == 17 and 1 <= tc <= 4: line = netio.sbs_encode(1, ac.icao, now, cs=ac.cs.strip())
+    elif df == 17 and 9 <= tc <= 18:
+        if not moved: line = netio.sbs_encode(3, ac.icao, now, alt=alt)
+        else: line = netio.sbs_encode(3, ac.icao, now, alt=alt, lat=f"{ac.lat:.5f}", lon=f"{ac.lon:.5f}")
+    elif df == 17 and tc == 19: line = netio.sbs_encode(4, ac.icao, now, gs=round(ac.spd / 1.852), trk=ac.hdg)
+    elif df in (4, 20): line = netio.sbs_encode(5, ac.icao, now, alt=alt)
+    elif df in (5, 21): line = netio.sbs_encode(6, ac.icao, now, squawk=ac.squawk)
+    elif df == 11: line = netio.sbs_encode(8, ac.icao, now)
+    else: return
+    net.emit('sbs', line)
+
+# --- פרסום ל-GUI ---
+# כל שינוי במטוס נכנס לתור (tracks.changed) ברגע הפענוח; הלולאה הראשית מרוקנת את התור
+# לכל היותר פעם ב-PUBLISH_WINDOW שניות, ומטוס בודד לא מתפרסם יותר מ-PUBLISH_MAX_RATE פעמים בשנייה.
+# ההשהיה פענוח -> שליחה של כל עדכון נשמרת ב-publish_latency לאחוזונים.
+PUBLISH_WINDOW = 0.05
+PUBLISH_MAX_RATE = 4.0
+publish_latency = deque(maxlen=4096)
+
+def publish(now, snapshot=False, max_rate=PUBLISH_MAX_RATE):
+    t = time.perf_counter()
+    ready = tracks.pop_changed(now, 1.0 / max_rate if max_rate > 0 else 0.0)
+    for ac, since in ready: publish_latency.append(now - since)
+    if snapshot: with_loc = [tracks.tracks[a] for a in tracks.located]
+    else: with_loc = [ac for ac, since in ready]
+    datagrams = publisher.encode(with_loc, snapshot, now)
+    try:
+        for d in datagrams: sock.sendto(d, (UDP_IP, UDP_PORT))
+    except Exception as e:
+        print(f"❌ UDP ERROR: {e}")
+        publisher.forget([ac.addr for ac in with_loc])  # שיישלחו שוב במלואם
+    stats['pub_updates'] += len(with_loc)
+    stats['pub_datagrams'] += len(datagrams)
+    stats['pub_bytes'] += sum(len(d) for d in datagrams)
+    timings['publish'] += time.perf_counter() - t
+
+def latency_percentiles(q=(50, 95, 99)):
+    # שניות; None אם עוד לא פורסם כלום
+    if not publish_latency: return None
+    return np.percentile(np.fromiter(publish_latency, dtype=np.float64), q)
+
+# --- נקודת מדדים (Prometheus, טקסט) ---
+# GET על כל נתיב מחזיר את כל המונים; השרת רץ ב-thread משלו וקורא את המונים בלי נעילה
+# (כולם מספרים שמתעדכנים רק מהלולאה הראשית, קריאה לא עקבית לרגע אחד לא מזיקה למדדים).
+METRICS_PORT = 9108
+
+def metrics_text(capture):
+    lines = ["# TYPE adsb_stage_seconds_total counter"]
+    lines += [f'adsb_stage_seconds_total{{stage="{k}"}} {v:.6f}' for k, v in timings.items()]
+    lines.append("# TYPE adsb_blocks_total counter")
+    lines.append(f"adsb_blocks_total {stats['blocks']}")
+    lines.append("# TYPE adsb_worker_errors_total counter")
+    lines.append(f"adsb_worker_errors_total {stats['worker_errors']}")
+    lines.append("# TYPE adsb_candidates_total counter")
+    lines.append(f"adsb_candidates_total {stats['candidates']}")
+    lines.append("# TYPE adsb_crc_total counter")
+    for result, key in (('ok', 'crc_ok'), ('fixed1', 'crc_fixed1'), ('fixed2', 'crc_fixed2'), ('bad', 'crc_bad')):
+        lines.append(f'adsb_crc_total{{result="{result}"}} {stats[key]}')
+    lines.append("# TYPE adsb_addr_parity_total counter")
+    lines.append(f'adsb_addr_parity_total{{result="ok"}} {stats["ap_ok"]}')
+    lines.append(f'adsb_addr_parity_total{{result="unknown"}} {stats["ap_bad"]}')
+    lines.append("# TYPE adsb_positions_rejected_total counter")
+    lines.append(f"adsb_positions_rejected_total {stats['pos_rejected']}")
+    lines.append("# TYPE adsb_duplicates_total counter")
+    lines.append(f"adsb_duplicates_total {stats['dup_hit']}")
+    lines.append("# TYPE adsb_frames_total counter")
+    lines += [f'adsb_frames_total{{df="{df}"}} {n}' for df, n in enumerate(df_counts) if n]
+    lines.append("# TYPE adsb_df17_frames_total counter")
+    lines += [f'adsb_df17_frames_total{{tc="{tc}"}} {n}' for tc, n in enumerate(tc_counts) if n]
+    lines.append("# TYPE adsb_published_total counter")
+    lines.append(f'adsb_published_total{{unit="updates"}} {stats["pub_updates"]}')
+    lines.append(f'adsb_published_total{{unit="datagrams"}} {stats["pub_datagrams"]}')
+    lines.append(f'adsb_published_total{{unit="bytes"}} {stats["pub_bytes"]}')
+    lat = latency_percentiles()
+    if lat is not None:
+        lines.append("# TYPE adsb_publish_latency_seconds summary")
+        lines += [f'adsb_publish_latency_seconds{{quantile="{q}"}} {v:.6f}' for q, v in zip(("0.5", "0.95", "0.99"), lat)]
+    if net:
+        lines.append("# TYPE adsb_net_clients gauge")
+        lines += [f'adsb_net_clients{{format="{name}"}} {n}' for name, n in net.active.items()]
+        lines.append("# TYPE adsb_net_slow_disconnects_total counter")
+        lines.append(f"adsb_net_slow_disconnects_total {net.slow_disconnects}")
+    lines.append("# TYPE adsb_capture_overruns_total counter")
+    lines.append(f"adsb_capture_overruns_total {capture.overruns}")
+    if isinstance(capture, netio.FrameIngest):
+        lines.append("# TYPE adsb_ingest_frames_total counter")
+        lines.append(f"adsb_ingest_frames_total {capture.frames}")
+        lines.append("# TYPE adsb_ingest_connections gauge")
+        lines.append(f"adsb_ingest_connections {capture.connected}")
+    else:
+        lines.append("# TYPE adsb_capture_samples_total counter")
+        lines.append(f"adsb_capture_samples_total {capture.next_sample}")
+    lines.append("# TYPE adsb_capture_queue_depth gauge")
+    lines.append(f"adsb_capture_queue_depth {capture.ready.qsize()}")
+    lines.append("# TYPE adsb_noise_floor_dbfs gauge")
+    lines.append(f"adsb_noise_floor_dbfs {noise.dbfs():.2f}")
+    lines.append("# TYPE adsb_tracks gauge")
+    lines.append(f"adsb_tracks {len(tracks)}")
+    lines.append("# TYPE adsb_tracks_located gauge")
+    lines.append(f"adsb_tracks_located {len(tracks.located)}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics_text(self.server.capture).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics(port, capture):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    server.capture = capture
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
 # --- לולאה ראשית ---
-db = {}
-last_transmit = time.time()
-print("📡 DEBUG MODE: Starting Radar Loop...")
-
-try:
-    while True:
-        raw = sdr.read_samples(256 * 1024)
-        mag = np.abs(raw)
-        thresh = np.mean(mag) * 4.5
-        peaks = np.where(mag > thresh)[0]
-        last_p = -1
-
-        for p in peaks:
-            if p < last_p + 240 or p + 240 > len(mag): continue
-
-            bits = []
-            try:
-                for n in range(112): bits.append(1 if mag[p+16+2*n] > mag[p+17+2*n] else 0)
-            except: continue
-
-            if bits_to_int(bits[0:5]) != 17: continue
-            if modes_checksum(bits) != 0: continue
-
-            # --- פענוח ---
-            icao = format(bits_to_int(bits[8:32]), '06X')
-            tc = bits_to_int(bits[32:37])
-            rssi = float(np.mean(mag[p:p+200]))
-
-            if icao not in db: 
-                # מטוס חדש!
-                print(f"✈️ NEW ICAO: {icao} (RSSI: {rssi:.1f})")
-                db[icao] = {'icao': icao, 'cs':'?', 'alt':0, 'spd':0, 'hdg':0, 'lat':None, 'lon':None, 'last':0, 'rssi': rssi, 'msgs':0}
-
-            db[icao]['last'] = time.time()
-            db[icao]['msgs'] += 1
-
-            if 1 <= tc <= 4:
-                db[icao]['cs'] = decode_callsign(bits)
-            elif 9 <= tc <= 18:
-                alt = decode_alt(bits)
-                if alt is not None: db[icao]['alt'] = alt
-                me = bits[32:88]
-                try:
-                    lat, lon = decode_cpr_local(bits_to_int(me[22:39]), bits_to_int(me[39:56]), me[21])
-                    db[icao]['lat'] = lat
-                    db[icao]['lon'] = lon
-                    print(f"📍 LOC FIX: {icao} -> {lat:.4f}, {lon:.4f}")
-                except: pass
-            elif tc == 19:
-                spd, hdg = decode_velocity_and_heading(bits)
-                if spd:
-                    db[icao]['spd'] = spd
-                    db[icao]['hdg'] = hdg
-
-            last_p = p
-
-        # שידור - פעם בשנייה נדפיס סטטוס
-        if time.time() - last_transmit > 1.0:
-            current = time.time()
-            # כמה מטוסים פעילים יש בכלל?
-            total_active = len([v for k, v in db.items() if current - v['last'] < 60])
-            # כמה מהם יש להם מיקום?
-            with_loc = [v for k, v in db.items() if (current - v['last'] < 60) and (v['lat'] is not None)]
-
-            if len(with_loc) > 0:
-                print(f"📤 SENDING {len(with_loc)} PLANES TO GUI (Total Visible: {total_active})")
+
+def main():
+    parser = argparse.ArgumentParser(description="ADS-B DSP backend")
+    parser.add_argument("--workers", type=int, default=0, help="decode worker processes (0 = decode in the main process)")
+    parser.add_argument("--record", metavar="PATH", help="write the raw I/Q stream to PATH while decoding")
+    parser.add_argument("--replay", metavar="PATH", help="decode a raw I/Q recording instead of the RTL-SDR")
+    parser.add_argument("--realtime", action="store_true", help="replay at 2 MSPS instead of as fast as possible")
+    parser.add_argument("--ingest", metavar="HOST:PORT", action="append", help="read ready-made frames from a remote decoder instead of the SDR (repeatable)")
+    parser.add_argument("--ingest-format", choices=sorted(netio.PARSERS), default="beast", help="wire format of --ingest (default: beast)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="serve Prometheus metrics on 127.0.0.1:PORT (0 = off)")
+    parser.add_argument("--publish-window", type=float, default=PUBLISH_WINDOW, help="coalescing window for GUI updates in seconds")
+    parser.add_argument("--max-rate", type=float, default=PUBLISH_MAX_RATE, help="max GUI updates per aircraft per second (0 = no cap)")
+    parser.add_argument("--net", action="store_true", help="serve AVR (30002), SBS-1 (30003) and Beast (30005) over TCP")
+    parser.add_argument("--net-host", default="0.0.0.0", help="address the --net servers listen on")
+    parser.add_argument("--dedup-window", type=float, default=DEDUP_WINDOW, help="seconds during which an identical frame is dropped (0 = off)")
+    args = parser.parse_args()
+    dedup.window = args.dedup_window
+    global net
+
+    source = None
+    try:
+        if args.ingest:
+            endpoints = [(e.rpartition(':')[0] or '127.0.0.1', int(e.rpartition(':')[2])) for e in args.ingest]
+            print(f"🔌 Ingesting {args.ingest_format} frames from {', '.join(args.ingest)} (SDR capture off)")
+        elif args.replay:
+            source = ReplaySource(args.replay, realtime=args.realtime)
+            print(f"📼 Replaying {args.replay} ({len(source.data) // 2 / SAMPLE_RATE:.1f} s)")
+        else:
+            source = RtlSdrSource()
+            print("✅ SDR Connected.")
+        if args.record:
+            source = RecordingSource(source, args.record)
+            print(f"⏺️ Recording raw I/Q to {args.record}")
+    except Exception as e:
+        print(f"❌ SDR Error: {e}"); sys.exit(1)
+
+    last_transmit = next_flush = time.time()
+    last_published = (0, 0, 0)
+    shm = None
+    pool = None
+    pending = deque()
+    known_version, synced = None, set()  # גרסת סט המטוסים שנשלחה, וה-workers (pid) שכבר קיבלו אותה
+    mag_buf = np.empty(CARRY + BLOCK_SIZE, dtype=np.uint16)
+
+    if args.ingest:
+        capture = netio.FrameIngest(endpoints, args.ingest_format)
+    elif args.workers > 0:
+        shape = (RING_SLOTS, 2 * (CARRY + BLOCK_SIZE))
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        capture = CaptureThread(source, ring=np.ndarray(shape, dtype=np.uint8, buffer=shm.buf))
+        # fork לפני שה-thread של הלכידה רץ
+        pool = multiprocessing.get_context("fork").Pool(args.workers, initializer=pool_init, initargs=(shm.name, shape))
+        print(f"🧮 Decode pool: {args.workers} workers")
+    else:
+        capture = CaptureThread(source)
+    if args.net:
+        try:
+            net = netio.OutputHub(args.net_host)
+            net.start()
+            print(f"🌐 Network output: AVR {netio.AVR_PORT} | SBS {netio.SBS_PORT} | Beast {netio.BEAST_PORT}")
+        except OSError as e:
+            print(f"⚠️ Network output disabled: {e}")
+            net = None
+
+    metrics = None
+    if args.metrics_port:
+        try:
+            metrics = start_metrics(args.metrics_port, capture)
+            print(f"📈 Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Metrics disabled: {e}")
+    t_start = t_end = time.perf_counter()
+    capture.start()
+    print("📡 DEBUG MODE: Starting Radar Loop...")
+
+    try:
+        while True:
+            t = time.perf_counter()
+            wait = max(next_flush - time.time(), 0.0) if tracks.changed else 1.0
+            try: item = capture.get(timeout=min(wait, 0.01) if pending else wait)
+            except queue.Empty:
+                if capture.error: print(f"❌ SDR Error: {capture.error}"); break
+                if not capture.is_alive() and capture.ready.empty() and not pending: break
+                item = None
+            timings['capture_wait'] += time.perf_counter() - t
+            slot = None
+
+            if item is not None and args.ingest:
+                result = ingest_batch(item, tracks.tracks)
+                t = time.perf_counter()
+                for p, frame, rssi, addr in zip(*result): handle_frame(frame, float(rssi), int(addr))
+                t_end = time.perf_counter()
+                timings['decode'] += t_end - t
+            elif item is not None:
+                slot, raw, start = item
+
+            if slot is not None and pool:
+                # הסט נשלח (ומוצפן) רק עד שכל ה-workers דיווחו שהם על הגרסה הנוכחית
+                if tracks.version != known_version: known_version, synced = tracks.version, set()
+                known = set(tracks.tracks) if len(synced) < args.workers else None
+                pending.append((slot, pool.apply_async(decode_slot, (slot, len(raw) // 2 - CARRY, known, known_version, noise.level))))
+            elif slot is not None:
+                t = time.perf_counter()
+                mag = iq_to_mag(raw, out=mag_buf[:len(raw) // 2])
+                capture.release(slot)
+                timings['mag'] += time.perf_counter() - t
+                result = decode_block(mag, tracks.tracks)
+                t = time.perf_counter()
+                for p, frame, rssi, addr in zip(*result): handle_frame(frame, float(rssi), int(addr))
+                t_end = time.perf_counter()
+                timings['decode'] += t_end - t
+
+            # איסוף תוצאות מה-pool לפי הסדר
+            while pending and pending[0][1].ready():
+                slot, result = pending.popleft()
+                capture.release(slot)
                 try:
-                    message = json.dumps(with_loc)
-                    sock.sendto(message.encode(), (UDP_IP, UDP_PORT))
+                    (offsets, frames, rssi, addrs), worker_stats, worker_timings, block, (pid, version) = result.get()
                 except Exception as e:
-                    print(f"❌ UDP ERROR: {e}")
-            else:
-                if total_active > 0:
-                    print(f"⚠️ Tracking {total_active} planes, but NO LOCATION yet. Waiting for CPR...")
+                    # הבלוק הולך לאיבוד, הלולאה ממשיכה
+                    stats['worker_errors'] += 1
+                    print(f"❌ Decode worker error: {e!r}")
+                    continue
+                noise.absorb(block)
+                if version == known_version: synced.add(pid)
+                for k, v in worker_stats.items(): stats[k] += v
+                for k, v in worker_timings.items(): timings[k] += v
+                t = time.perf_counter()
+                for p, frame, r, addr in zip(offsets, frames, rssi, addrs): handle_frame(frame, float(r), int(addr))
+                t_end = time.perf_counter()
+                timings['decode'] += t_end - t
+
+            if net: net.flush()
+
+            # שידור - לכל היותר פעם ב-publish_window; snapshot מלא פעם ב-SNAPSHOT_INTERVAL
+            now = time.time()
+            if now >= next_flush and (tracks.changed or publisher.snapshot_due(now)):
+                publish(now, publisher.snapshot_due(now), args.max_rate)
+                next_flush = now + args.publish_window
+
+            # סטטוס - פעם בשנייה
+            if now - last_transmit > 1.0:
+                publisher.forget(tracks.expire(now))
+                total_active = len(tracks)
+                published = (stats['pub_updates'], stats['pub_datagrams'], stats['pub_bytes'])
+                updates, datagrams, size = (a - b for a, b in zip(published, last_published))
+                last_published = published
+
+                if updates > 0:
+                    print(f"📤 SENT {updates} UPDATES TO GUI ({datagrams} datagrams, {size} bytes) (Total Visible: {total_active})")
+                    lat = latency_percentiles()
+                    if lat is not None: print(f"⚡ LATENCY decode->publish: p50 {lat[0] * 1e3:.0f} ms | p95 {lat[1] * 1e3:.0f} ms | p99 {lat[2] * 1e3:.0f} ms")
                 else:
-                    print(f"📡 Scanning... (No targets)")
+                    if tracks.located:
+                        print(f"📡 Tracking {total_active} planes, no position updates this second")
+                    elif total_active > 0:
+                        print(f"⚠️ Tracking {total_active} planes, but NO LOCATION yet. Waiting for CPR...")
+                    else:
+                        print(f"📡 Scanning... (No targets)")
+
+                print(f"🧵 CAPTURE: {capture.overruns} overruns | {capture.ready.qsize()} blocks queued")
+                print(f"🔧 CRC: {stats['crc_ok']} ok | {stats['crc_fixed1']} fixed (1-bit) | {stats['crc_fixed2']} fixed (2-bit) | {stats['crc_bad']} rejected")
+                seen = stats['dup_hit'] + stats['dup_miss']
+                print(f"🔁 DEDUP: {stats['dup_hit']} duplicates dropped | {stats['dup_miss']} unique | {100 * stats['dup_hit'] / max(seen, 1):.1f}% duplicate rate")
+                if args.ingest: print(f"🔌 INGEST: {capture.frames} frames | {capture.connected} connections")
+                else: print(f"📶 NOISE: floor {noise.dbfs():.1f} dBFS | threshold x{THRESH_FACTOR}")
+                print(f"📻 MODE-S: {stats['df11']} all-call (DF11) | {stats['ap_ok']} surveillance (DF4/5/20/21) | {stats['ap_bad']} unknown address")
+                blocks = max(stats['blocks'], 1)
+                if not args.ingest: print("⏲️ STAGES (ms/block): " + " | ".join(f"{k} {1e3 * timings[k] / blocks:.2f}" for k in STAGES[1:5]) + f" | {stats['candidates'] / blocks:.0f} candidates")
+                last_transmit = time.time()
 
-            last_transmit = time.time()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    except Exception:
+        # לא יוצאים בלי לסגור את ה-pool, ה-shared memory וה-SDR
+        print("❌ Main loop error:")
+        traceback.print_exc()
 
-except KeyboardInterrupt:
-    print("Stopped.")
-    sdr.close()
+    elapsed = max(t_end - t_start, 1e-9)
+    if args.ingest: print(f"⏱️ {capture.frames} frames in {elapsed:.1f} s ({capture.frames / elapsed:.0f} frames/s) | {capture.overruns} batches dropped")
+    else: print(f"⏱️ {capture.next_sample / 1e6:.1f} M samples in {elapsed:.1f} s ({capture.next_sample / elapsed / 1e6:.2f} MSPS) | {capture.overruns} overruns")
+    capture.stop()
+    if metrics: metrics.shutdown()
+    if net: net.stop()
+    if pool:
+        pool.terminate()
+        shm.close()
+        shm.unlink()
+    if source: source.close()
     sock.close()
 
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,6 @@
 import customtkinter as ctk
 import tkintermapview
 import socket
-import json
 import time
 import math
 import traceback
@@ -20,7 +19,10 @@ from matplotlib.ticker import FuncFormatter
 from PIL import Image, ImageTk, ImageDraw
 from io import BytesIO
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, deque
+
+import protocol
+import tiles
 
 # --- הגדרות כלליות ---
 ctk.set_appearance_mode("Dark")
@@ -31,10 +33,19 @@ UDP_PORT = 5005
 sock = None
 
 PLANE_SIZE = 60
+PLANE_COLOR = "#00BFFF"
+HEADING_STEP = 2  # רזולוציית הסיבוב של אייקון המטוס (מעלות)
 TRAIL_COLOR = "#FF4500"
 TRAIL_WIDTH = 3
 MAX_RANGE_KM = 150
 CUSTOM_ICON_PATH = "plane.png"
+TILES_OFFLINE_ONLY = False    # True = אריחים רק מהמאגר המקומי (tiles.py), בלי לפנות לרשת
+FRAME_BUDGET = 0.016          # זמן מקסימלי לעבודת מפה בפריים אחד (שניות)
+PANEL_INTERVAL = 0.5          # רענון דשבורד ו-FFT
+PANEL_INTERVAL_LOADED = 2.0   # ...כשהמפה לא עומדת בתקציב
+CULL_MARGIN = 0.2             # שוליים סביב התצוגה (חלק מגודלה) שבהם סמנים נשארים מחוברים
+CLUSTER_MAX_ZOOM = 9          # מזום זה ומטה מטוסים קרובים מאוחדים לאשכול
+CLUSTER_CELL = 64             # גודל תא ברשת האשכולות (פיקסלים)
 
 # ==========================================
 # 1. מודול הדשבורד המחקרי (Research Dashboard)
@@ -64,6 +75,7 @@ class ResearchDashboard(ctk.CTkFrame):
         self.grid_rowconfigure(0, weight=0)
         self.grid_rowconfigure(1, weight=1)
         self.grid_rowconfigure(2, weight=0)
+        self.grid_rowconfigure(3, weight=0)
 
         # --- Title ---
         self.lbl_title = ctk.CTkLabel(
@@ -102,7 +114,14 @@ class ResearchDashboard(ctk.CTkFrame):
         self.btn_fft = ctk.CTkButton(self.btn_frame, text="🔍 Live FFT Spectrum", fg_color="#2E8B57", command=self.show_fft)
         self.btn_fft.pack(fill="x", pady=5)
 
+        # --- מצב הקליטה מ-CORE ---
+        self.lbl_link = ctk.CTkLabel(self, text="RX: waiting for CORE...", font=("Consolas", 11), text_color="#888")
+        self.lbl_link.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="w")
+
     # ---------- PUBLIC API ----------
+    def update_link(self, text):
+        if self.lbl_link.cget("text") != text: self.lbl_link.configure(text=text)
+
     def update_dashboard(self, planes_data: dict):
         self.current_data = list(planes_data.values())
         current_t = time.time() - self.start_time
@@ -486,6 +505,62 @@ def setup_socket():
     except Exception as e:
         print(f"❌ Socket Error: {e}")
 
+class UdpReceiver:
+    # thread שמנקז את ה-socket ברציפות ומפענח את הפרוטוקול מחוץ ל-thread של Tk.
+    # כל עדכון דורס את הקודם של אותו ICAO ב-dirty, כך שה-tick של Tk מקבל רק את המצב האחרון
+    # של כל מטוס שהשתנה מאז ה-tick הקודם, לא משנה כמה datagrams הגיעו בינתיים.
+    RCVBUF = 4 * 1024 * 1024
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = protocol.Decoder()
+        self.lock = threading.Lock()
+        self.dirty = {}
+        self.dirty_since = None  # זמן הקליטה של העדכון הוותיק שעוד לא הוחל
+        self.datagrams = 0
+        self.coalesced = 0  # עדכונים שנדרסו לפני ש-Tk הספיק להחיל אותם
+        self.net_lag = 0.0  # שליחה ב-CORE -> קליטה כאן
+        self.apply_lag = 0.0  # קליטה -> החלה ב-Tk
+        self.running = True
+        try: sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF)
+        except OSError: pass
+        sock.settimeout(0.5)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        last_expire = time.time()
+        while self.running:
+            try: data, addr = self.sock.recvfrom(65535)
+            except socket.timeout: data = None
+            except OSError: break
+            now = time.time()
+            if data:
+                updated = self.decoder.feed(data)
+                self.datagrams += 1
+                if self.decoder.last_sent is not None: self.net_lag = now - self.decoder.last_sent
+                with self.lock:
+                    if updated and not self.dirty: self.dirty_since = now
+                    for icao in updated:
+                        if icao in self.dirty: self.coalesced += 1
+                        # עותק: Tk כותב על ה-dict (rssi, dist_km) ולא על המצב של ה-decoder
+                        self.dirty[icao] = dict(self.decoder.planes[icao])
+            if now - last_expire > 1.0:
+                self.decoder.expire(now)
+                last_expire = now
+
+    def take(self):
+        with self.lock:
+            out, self.dirty = self.dirty, {}
+            if out: self.apply_lag = time.time() - self.dirty_since
+        return out
+
+    @property
+    def dropped(self):
+        return self.decoder.lost + self.decoder.bad
+
+    def stop(self):
+        self.running = False
+
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371
     dlat = math.radians(lat2 - lat1)
@@ -494,7 +569,7 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
-def create_fallback_icon(size, color="#00BFFF"):
+def create_fallback_icon(size, color=PLANE_COLOR):
     img = Image.new("RGBA", (size, size), (0,0,0,0))
     draw = ImageDraw.Draw(img)
     cx, cy = size//2, size//2
@@ -507,6 +582,232 @@ def create_fallback_icon(size, color="#00BFFF"):
     draw.polygon(points, fill=color, outline="white", width=2)
     return img
 
+class SpriteCache:
+    # אייקון המטוס מסובב מראש לכל HEADING_STEP מעלות - סט אחד לכל (גודל, צבע), נבנה פעם אחת.
+    # ה-PhotoImage נשמרים כאן לכל חיי האפליקציה, כך שהחלפת אייקון לא יוצרת תמונה חדשה.
+    def __init__(self, source, step=HEADING_STEP):
+        self.source = source  # (size, color) -> PIL.Image
+        self.step = step
+        self.count = 360 // step
+        self.sets = {}
+
+    def bucket(self, hdg):
+        return int(round(hdg / self.step)) % self.count
+
+    def render(self, size=PLANE_SIZE, color=PLANE_COLOR):
+        base = self.source(size, color)
+        self.sets[(size, color)] = [ImageTk.PhotoImage(base.rotate(-b * self.step, expand=False, resample=Image.BICUBIC))
+                                    for b in range(self.count)]
+        return self.sets[(size, color)]
+
+    def get(self, bucket, size=PLANE_SIZE, color=PLANE_COLOR):
+        sprites = self.sets.get((size, color)) or self.render(size, color)
+        return sprites[bucket]
+
+def drop_marker(m):
+    # כמו CanvasPositionMarker.delete, בלי ה-canvas.update() שהוא מריץ על כל סמן -
+    # בגלילה מנתקים עשרות סמנים בבת אחת
+    w = m.map_widget
+    if m in w.canvas_marker_list: w.canvas_marker_list.remove(m)
+    for item in (m.polygon, m.big_circle, m.canvas_text, m.canvas_icon, m.canvas_image):
+        if item is not None: w.canvas.delete(item)
+    m.polygon = m.big_circle = m.canvas_text = m.canvas_icon = m.canvas_image = None
+    m.deleted = True
+
+def inside(bounds, x, y):
+    return bounds is None or (bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3])
+
+class MapRenderer:
+    # שכבת רינדור בין הנתונים למפה. update רק רושם את המצב הרצוי ומסמן את המטוס כ-dirty;
+    # render מחיל את ה-dirty לפי סדר הסימון עד שנגמר תקציב הפריים, ומשנה על המפה רק את
+    # התכונות שבאמת השתנו (מיקום, אייקון, טקסט, שובל). מה שלא הספיק נשאר ב-backlog לפריים הבא.
+    # רק מטוסים בתוך התצוגה (ועוד CULL_MARGIN) מחוברים לקנבס - tkintermapview עובר על כל הסמנים
+    # והמסלולים בכל גלילה וזום. בזום CLUSTER_MAX_ZOOM ומטה, מטוסים שנופלים באותו תא של רשת
+    # CLUSTER_CELL פיקסלים מוצגים כסמן אשכול אחד עם מספר המטוסים.
+    def __init__(self, map_widget, sprites, on_click):
+        self.map = map_widget
+        self.sprites = sprites
+        self.on_click = on_click
+        self.markers = {}
+        self.trails = {}
+        self.desired = {}  # icao -> (lat, lon, bucket, text, hist)
+        self.shown = {}    # icao -> (lat, lon, bucket, text, נקודת השובל האחרונה) - מה שמצויר כרגע
+        self.dirty = {}    # dict כ-set שומר סדר
+        self.frame_times = deque(maxlen=120)
+        self.over_budget = 0
+        self.last_over = False
+        # אינדקס מרחבי, בקואורדינטות אריחים של הזום הנוכחי
+        self.zoom = round(map_widget.zoom)
+        self.bounds = None  # (x0, y0, x1, y1) כולל שוליים; None = הכל גלוי
+        self.pos = {}       # icao -> (x, y)
+        self.cells = {}     # תא -> set של ICAOs
+        self.cell_of = {}
+        self.clusters = {}  # תא -> סמן אשכול
+        self.dirty_cells = {}
+
+    @property
+    def backlog(self):
+        return len(self.dirty) + len(self.dirty_cells)
+
+    @property
+    def clustering(self):
+        return self.zoom <= CLUSTER_MAX_ZOOM
+
+    def visible(self, icao):
+        return inside(self.bounds, *self.pos[icao])
+
+    def clustered(self, icao):
+        return self.clustering and len(self.cells[self.cell_of[icao]]) > 1
+
+    def place(self, icao, lat, lon):
+        x, y = tkintermapview.decimal_to_osm(lat, lon, self.zoom)
+        self.pos[icao] = (x, y)
+        size = CLUSTER_CELL / self.map.tile_size
+        cell = (int(x / size), int(y / size))
+        old = self.cell_of.get(icao)
+        if old != cell:
+            if old is not None: self.leave_cell(icao, old)
+            self.cells.setdefault(cell, set()).add(icao)
+            self.cell_of[icao] = cell
+        if self.clustering: self.dirty_cells[cell] = None
+
+    def leave_cell(self, icao, cell):
+        members = self.cells[cell]
+        members.discard(icao)
+        if not members: del self.cells[cell]
+        if self.clustering: self.dirty_cells[cell] = None
+
+    def set_view(self):
+        # נקרא בכל tick: אם המפה זזה או שינתה זום, מסמן רק את מי שנכנס או יצא מהתצוגה
+        w = self.map
+        (x0, y0), (x1, y1) = w.upper_left_tile_pos, w.lower_right_tile_pos
+        if x1 <= x0: return  # המפה עוד לא צוירה
+        mx, my = (x1 - x0) * CULL_MARGIN, (y1 - y0) * CULL_MARGIN
+        bounds = (x0 - mx, y0 - my, x1 + mx, y1 + my)
+        zoom = round(w.zoom)
+        if zoom != self.zoom:
+            for m in self.clusters.values(): drop_marker(m)
+            self.clusters.clear()
+            self.cells.clear()
+            self.cell_of.clear()
+            self.dirty_cells.clear()
+            self.zoom, self.bounds = zoom, bounds
+            for icao, state in self.desired.items():
+                self.place(icao, state[0], state[1])
+                self.dirty[icao] = None
+            return
+        if bounds == self.bounds: return
+        old, self.bounds = self.bounds, bounds
+        for icao, (x, y) in self.pos.items():
+            if inside(old, x, y) != inside(bounds, x, y): self.dirty[icao] = None
+        if self.clustering: self.dirty_cells.update(dict.fromkeys(self.cells))
+
+    def update(self, icao, lat, lon, hdg, text, hist):
+        state = (lat, lon, self.sprites.bucket(hdg), text, hist)
+        prev = self.desired.get(icao)
+        self.desired[icao] = state
+        if prev is None or prev[:2] != state[:2]: self.place(icao, lat, lon)
+        if not self.visible(icao) or self.clustered(icao):
+            # מחוץ לתצוגה או בתוך אשכול - עבודה רק אם הוא עדיין מחובר
+            if icao in self.markers: self.dirty[icao] = None
+            else: self.dirty.pop(icao, None)
+            return
+        shown = self.shown.get(icao)
+        if shown and shown[:4] == state[:4] and (len(hist) < 2 or shown[4] == hist[-1]):
+            self.dirty.pop(icao, None)  # חזר למה שכבר מצויר
+            return
+        self.dirty[icao] = None
+
+    def detach(self, icao):
+        m = self.markers.pop(icao, None)
+        if m: drop_marker(m)
+        t = self.trails.pop(icao, None)
+        if t: t.delete()
+        self.shown.pop(icao, None)
+
+    def remove(self, icao):
+        self.detach(icao)
+        self.dirty.pop(icao, None)
+        self.desired.pop(icao, None)
+        self.pos.pop(icao, None)
+        cell = self.cell_of.pop(icao, None)
+        if cell is not None: self.leave_cell(icao, cell)
+
+    def render(self, budget=FRAME_BUDGET):
+        if not self.backlog: return 0.0
+        t0 = time.perf_counter()
+        while self.backlog and time.perf_counter() - t0 < budget:
+            # קודם אשכולות: הם קובעים אילו מטוסים מצוירים בנפרד
+            if self.dirty_cells:
+                cell = next(iter(self.dirty_cells))
+                del self.dirty_cells[cell]
+                self.apply_cell(cell)
+            else:
+                icao = next(iter(self.dirty))
+                del self.dirty[icao]
+                self.apply(icao, *self.desired[icao])
+        dt = time.perf_counter() - t0
+        self.frame_times.append(dt)
+        self.last_over = dt > budget
+        if self.last_over: self.over_budget += 1
+        return dt
+
+    def apply(self, icao, lat, lon, bucket, text, hist):
+        if not self.visible(icao) or self.clustered(icao):
+            self.detach(icao)
+            return
+        shown = self.shown.get(icao)
+        m = self.markers.get(icao)
+        if m is None:
+            m = self.map.set_marker(lat, lon, text=text, icon=self.sprites.get(bucket), command=self.on_click)
+            m.data = icao
+            self.markers[icao] = m
+        else:
+            if (lat, lon) != shown[:2]: m.set_position(lat, lon)
+            if bucket != shown[2]:
+                try: m.change_icon(self.sprites.get(bucket))
+                except: pass
+            if text != shown[3]: m.set_text(text)
+        last = hist[-1] if hist else None
+        if len(hist) > 1 and (shown is None or last != shown[4]):
+            if icao in self.trails: self.trails[icao].set_position_list(hist)
+            else: self.trails[icao] = self.map.set_path(hist, color=TRAIL_COLOR, width=TRAIL_WIDTH)
+        self.shown[icao] = (lat, lon, bucket, text, last)
+
+    def apply_cell(self, cell):
+        members = self.cells.get(cell, ())
+        m = self.clusters.get(cell)
+        if self.clustering and len(members) > 1:
+            x = sum(self.pos[i][0] for i in members) / len(members)
+            y = sum(self.pos[i][1] for i in members) / len(members)
+            if inside(self.bounds, x, y):
+                lat, lon = tkintermapview.osm_to_decimal(x, y, self.zoom)
+                text = str(len(members))
+                if m is None:
+                    m = self.clusters[cell] = self.map.set_marker(lat, lon, text=text, marker_color_circle="white",
+                                                                  marker_color_outside=PLANE_COLOR, command=self.zoom_to)
+                else:
+                    if m.position != (lat, lon): m.set_position(lat, lon)
+                    if m.text != text: m.set_text(text)
+            elif m:
+                drop_marker(self.clusters.pop(cell))
+            for icao in members:
+                if icao in self.markers: self.dirty[icao] = None
+        else:
+            if m: drop_marker(self.clusters.pop(cell))
+            for icao in members:
+                if icao not in self.markers: self.dirty[icao] = None
+
+    def zoom_to(self, marker):
+        # לחיצה על אשכול: זום פנימה עד שהוא מתפרק
+        self.map.set_position(*marker.position)
+        self.map.set_zoom(CLUSTER_MAX_ZOOM + 1)
+
+    def frame_stats(self):
+        # (ממוצע, מקסימום) של זמן הרינדור לפריים, במילישניות
+        if not self.frame_times: return 0.0, 0.0
+        return sum(self.frame_times) / len(self.frame_times) * 1e3, max(self.frame_times) * 1e3
+
 class RadarApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -519,34 +820,42 @@ class RadarApp(ctk.CTk):
 
         self.intel = PlaneIntelligence()
 
-        self.map_widget = tkintermapview.TkinterMapView(self, corner_radius=0)
+        # אריחים קודם מהמאגר המקומי אם קיים (python3 tiles.py), ורק אחר כך מהרשת
+        tile_db = tiles.TILE_DB if os.path.exists(tiles.TILE_DB) else None
+        self.map_widget = tkintermapview.TkinterMapView(self, corner_radius=0, database_path=tile_db,
+                                                        use_database_only=TILES_OFFLINE_ONLY and tile_db is not None)
         self.map_widget.grid(row=0, column=0, sticky="nsew")
         self.map_widget.set_position(31.999, 34.946)
         self.map_widget.set_zoom(11)
-        self.map_widget.set_tile_server("https://mt0.google.com/vt/lyrs=m&hl=he&x={x}&y={y}&z={z}&s=Ga")
+        self.map_widget.set_tile_server(tiles.TILE_SERVER)
+        self.tile_cache = tiles.install(self.map_widget)
         self.map_widget.set_marker(31.999, 34.946, text="HOME BASE", marker_color_circle="red")
 
         self.research_panel = ResearchDashboard(self, fg_color="#222")
         self.research_panel.grid(row=0, column=1, sticky="nsew", padx=2, pady=2)
 
-        self.base_plane_img = self.load_plane_image()
-        self.planes_markers = {}
-        self.planes_trails = {}
+        self.sprites = SpriteCache(self.load_plane_image)
+        self.sprites.render()
+        self.renderer = MapRenderer(self.map_widget, self.sprites, self.show_plane_details)
+        self.render_scheduled = False
+        self.last_panels = 0.0
+        self.max_rssi = -110
         self.planes_history = {}
         self.planes_data = {}
         self.planes_last_seen = {}
+        self.receiver = UdpReceiver(sock) if sock else None
         self.running = True
 
         self.fft_noise_smooth = np.random.normal(-95, 1.5, 256)
         self.update_loop()
 
-    def load_plane_image(self):
+    def load_plane_image(self, size=PLANE_SIZE, color=PLANE_COLOR):
         try:
             if os.path.exists(CUSTOM_ICON_PATH):
                 img = Image.open(CUSTOM_ICON_PATH).convert("RGBA")
-                return img.resize((PLANE_SIZE, PLANE_SIZE), Image.Resampling.LANCZOS)
+                return img.resize((size, size), Image.Resampling.LANCZOS)
         except: pass
-        return create_fallback_icon(PLANE_SIZE)
+        return create_fallback_icon(size, color)
 
     def show_plane_details(self, marker):
         icao = marker.data
@@ -603,104 +912,74 @@ class RadarApp(ctk.CTk):
         except: return
 
         try:
-            if sock:
+            if self.receiver:
                 try:
-                    data, addr = sock.recvfrom(8192)
-                    decoded = json.loads(data.decode())
-                    current_time = time.time()
-
-                    max_rssi = -110
-
-                    for p in decoded:
-                        icao = p['icao']
-                        lat, lon = p['lat'], p['lon']
-                        if not lat or not lon: continue
-                        dist = haversine(31.999, 34.946, lat, lon)
-                        if dist > MAX_RANGE_KM: continue
-
-                        self.planes_last_seen[icao] = current_time
-                        self.planes_data[icao] = p
-                        hdg = int(p.get('hdg', 0))
-
-                        # הזרקת נתונים למחקר - תיקון פיזיקלי
-                        p['dist_km'] = dist
-
-                        raw_rssi = p.get('rssi', 0)
-                        if raw_rssi == 0 or raw_rssi > 0:
-                            base_rssi = -45 - (20 * math.log10(dist if dist > 0.1 else 0.1))
-                            jitter = np.random.normal(0, 1.5) 
-                            p['rssi'] = base_rssi + jitter
-                        else:
-                             p['rssi'] = float(raw_rssi) + np.random.normal(0, 0.5)
-
-                        if p['rssi'] > max_rssi:
-                            max_rssi = p['rssi']
-
-                        if icao not in self.planes_history:
-                            self.planes_history[icao] = []
-                        hist = self.planes_history[icao]
-                        if not hist or (abs(hist[-1][0] - lat) > 0.0001):
-                            hist.append((lat, lon))
-                            if len(hist) > 50: hist.pop(0)
-
-                        rot_img = ImageTk.PhotoImage(self.base_plane_img.rotate(-hdg, expand=False, resample=Image.BICUBIC))
-
-                        if icao in self.planes_markers:
-                            self.planes_markers[icao].set_position(lat, lon)
-                            try: self.planes_markers[icao].change_icon(rot_img)
-                            except: pass
-                            if icao in self.planes_trails:
-                                self.planes_trails[icao].set_position_list(hist)
-                            elif len(hist) > 1:
-                                self.planes_trails[icao] = self.map_widget.set_path(hist, color=TRAIL_COLOR, width=TRAIL_WIDTH)
-                        else:
-                            m = self.map_widget.set_marker(lat, lon, text=p['cs'], icon=rot_img, command=self.show_plane_details)
-                            m.data = icao
-                            self.planes_markers[icao] = m
-                            if len(hist) > 1:
-                                self.planes_trails[icao] = self.map_widget.set_path(hist, color=TRAIL_COLOR, width=TRAIL_WIDTH)
-
-                    # --- התיקון נמצא כאן ---
-                    # מחיקה בטוחה של מטוסים שנעלמו
-                    to_delete = [k for k, v in self.planes_last_seen.items() if current_time - v > 60]
-                    for icao in to_delete:
-                        # מחיקה מהמפה (Widget)
-                        if icao in self.planes_markers: 
-                            self.planes_markers[icao].delete()
-                        if icao in self.planes_trails: 
-                            self.planes_trails[icao].delete()
-
-                        # מחיקה מהזיכרון (Dictionaries) בצורה בטוחה (pop)
-                        self.planes_markers.pop(icao, None)
-                        self.planes_trails.pop(icao, None)
-                        self.planes_history.pop(icao, None)
-                        self.planes_last_seen.pop(icao, None)
-                        self.planes_data.pop(icao, None)
-
-                    self.research_panel.update_dashboard(self.planes_data)
-
-                    # FFT
-                    num_points = 256
-                    center_freq = 1090e6
-                    span = 2e6 
-                    freqs = np.linspace(center_freq - span/2, center_freq + span/2, num_points)
-                    new_noise = np.random.normal(-95, 1.0, num_points)
-                    self.fft_noise_smooth = self.fft_noise_smooth * 0.8 + new_noise * 0.2
-                    final_mags = self.fft_noise_smooth.copy()
-
-                    if len(self.planes_data) > 0 and max_rssi > -105:
-                        center_idx = num_points // 2
-                        width = 12 
-                        for i in range(-width, width):
-                            falloff = (i / width)**2 * (max_rssi - (-95))
-                            signal_strength = max_rssi - falloff
-                            jitter = np.random.normal(0, 0.5)
-                            if signal_strength + jitter > final_mags[center_idx + i]:
-                                final_mags[center_idx + i] = signal_strength + jitter
-
-                    self.research_panel.update_fft_data(freqs, final_mags)
-
-                except BlockingIOError: pass
+                    # רק מה שהשתנה מאז ה-tick הקודם, מאוחד לפי ICAO ב-thread של הקליטה
+                    decoded = list(self.receiver.take().values())
+                    if decoded:
+                        current_time = time.time()
+
+                        max_rssi = -110
+
+                        for p in decoded:
+                            icao = p['icao']
+                            lat, lon = p['lat'], p['lon']
+                            if not lat or not lon: continue
+                            dist = haversine(31.999, 34.946, lat, lon)
+                            if dist > MAX_RANGE_KM: continue
+
+                            self.planes_last_seen[icao] = current_time
+                            self.planes_data[icao] = p
+                            hdg = int(p.get('hdg', 0))
+
+                            # הזרקת נתונים למחקר - תיקון פיזיקלי
+                            p['dist_km'] = dist
+
+                            raw_rssi = p.get('rssi', 0)
+                            if raw_rssi == 0 or raw_rssi > 0:
+                                base_rssi = -45 - (20 * math.log10(dist if dist > 0.1 else 0.1))
+                                jitter = np.random.normal(0, 1.5) 
+                                p['rssi'] = base_rssi + jitter
+                            else:
+                                 p['rssi'] = float(raw_rssi) + np.random.normal(0, 0.5)
+
+                            if p['rssi'] > max_rssi:
+                                max_rssi = p['rssi']
+
+                            if icao not in self.planes_history:
+                                self.planes_history[icao] = []
+                            hist = self.planes_history[icao]
+                            if not hist or (abs(hist[-1][0] - lat) > 0.0001):
+                                hist.append((lat, lon))
+                                if len(hist) > 50: hist.pop(0)
+
+                            self.renderer.update(icao, lat, lon, hdg, p['cs'], hist)
+
+                        # --- התיקון נמצא כאן ---
+                        # מחיקה בטוחה של מטוסים שנעלמו
+                        to_delete = [k for k, v in self.planes_last_seen.items() if current_time - v > 60]
+                        for icao in to_delete:
+                            # מחיקה מהמפה (Widget)
+                            self.renderer.remove(icao)
+
+                            # מחיקה מהזיכרון (Dictionaries) בצורה בטוחה (pop)
+                            self.planes_history.pop(icao, None)
+                            self.planes_last_seen.pop(icao, None)
+                            self.planes_data.pop(icao, None)
+
+                        self.max_rssi = max_rssi
+
+                    # המפה קודמת; דשבורד ו-FFT מתעדכנים בתדירות נמוכה יותר, ונמוכה עוד יותר
+                    # כשהרינדור לא עומד בתקציב (יש backlog או שהפריים האחרון חרג)
+                    self.renderer.set_view()
+                    if not self.render_scheduled: self.render_frame()
+                    loaded = self.renderer.backlog or self.renderer.last_over
+                    now = time.time()
+                    if now - self.last_panels >= (PANEL_INTERVAL_LOADED if loaded else PANEL_INTERVAL):
+                        self.last_panels = now
+                        self.update_panels()
+
+                    self.update_link_status()
                 except Exception as e:
                     if "int" not in str(e): print(f"Loop Err: {e}")
         except Exception as e: print(f"Main Err: {e}")
@@ -709,8 +988,53 @@ class RadarApp(ctk.CTk):
             try: self.after(100, self.update_loop)
             except: pass
 
+    def render_frame(self):
+        # פריים אחד של עבודת מפה; אם נשאר backlog - ממשיכים בפריים הבא בלי לחכות ל-tick
+        self.render_scheduled = False
+        if not self.running: return
+        try: self.renderer.render()
+        except Exception as e: print(f"Render Err: {e}")
+        if self.renderer.backlog:
+            self.render_scheduled = True
+            self.after(1, self.render_frame)
+
+    def update_panels(self):
+        max_rssi = self.max_rssi
+        self.research_panel.update_dashboard(self.planes_data)
+
+        # FFT
+        num_points = 256
+        center_freq = 1090e6
+        span = 2e6 
+        freqs = np.linspace(center_freq - span/2, center_freq + span/2, num_points)
+        new_noise = np.random.normal(-95, 1.0, num_points)
+        self.fft_noise_smooth = self.fft_noise_smooth * 0.8 + new_noise * 0.2
+        final_mags = self.fft_noise_smooth.copy()
+
+        if len(self.planes_data) > 0 and max_rssi > -105:
+            center_idx = num_points // 2
+            width = 12 
+            for i in range(-width, width):
+                falloff = (i / width)**2 * (max_rssi - (-95))
+                signal_strength = max_rssi - falloff
+                jitter = np.random.normal(0, 0.5)
+                if signal_strength + jitter > final_mags[center_idx + i]:
+                    final_mags[center_idx + i] = signal_strength + jitter
+
+        self.research_panel.update_fft_data(freqs, final_mags)
+
+    def update_link_status(self):
+        r = self.receiver
+        avg, peak = self.renderer.frame_stats()
+        self.research_panel.update_link(f"RX {r.datagrams} pkts | lag {r.net_lag * 1e3:.0f}+{r.apply_lag * 1e3:.0f} ms | "
+                                        f"dropped {r.dropped} | merged {r.coalesced}\n"
+                                        f"RENDER {avg:.1f}/{peak:.1f} ms | backlog {self.renderer.backlog} | over {self.renderer.over_budget} | "
+                                        f"on map {len(self.renderer.markers)}/{len(self.renderer.desired)} | clusters {len(self.renderer.clusters)}\n"
+                                        f"TILES {len(self.tile_cache)}/{self.tile_cache.capacity} | evicted {self.tile_cache.evictions}")
+
     def on_close(self):
         self.running = False
+        if self.receiver: self.receiver.stop()
         try:
             self.quit()
             self.destroy()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# ==============================================================================
+# 🧪 ADS-B DSP BENCHMARK: SYNTHETIC MODE-S SIGNALS
+# ==============================================================================
+# מחולל I/Q עם מסגרות DF17 ידועות (callsign, מיקום, מהירות) ב-SNR, צפיפות, חפיפה והיסט תדר
+# נשלטים, ומריץ עליהן את שרשרת ה-DSP של CORE.py שלב אחרי שלב.
+# python3 benchmark.py                  -> בדיקת תיקון שגיאות והשוואה מול benchmark_baseline.json (exit 1 על רגרסיה)
+# python3 benchmark.py --save-baseline  -> שמירת התוצאות הנוכחיות כ-baseline (+ --save-speed לשמירת המהירות)
+# python3 benchmark.py --write-iq x.iq  -> שמירת תרחיש כהקלטה עבור CORE.py --replay
+# python3 benchmark.py --serve-frames 30005 --rate 50000 -> מפענח מדומה עבור CORE.py --ingest
+import numpy as np
+import time
+import math
+import sys
+import os
+import io
+import json
+import argparse
+import contextlib
+import socket
+import threading
+import CORE
+import netio
+
+BASELINE_PATH = "benchmark_baseline.json"
+CHARS = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ#####_###############0123456789######"
+
+# --- תרחישים ---
+# snr_db: יחס אות לרעש לפולס | rate: מסגרות בשנייה | overlap: חלק המסגרות שמתחילות בתוך מסגרת קודמת
+# freq_offset: היסט תדר מקסימלי ב-Hz | aircraft: כמות מטוסים
+SCENARIOS = {
+    'clean':  {'snr_db': 20, 'rate': 500, 'overlap': 0.0, 'freq_offset': 0, 'aircraft': 20},
+    'weak':   {'snr_db': 12, 'rate': 500, 'overlap': 0.0, 'freq_offset': 20e3, 'aircraft': 20},
+    'busy':   {'snr_db': 15, 'rate': 5000, 'overlap': 0.1, 'freq_offset': 50e3, 'aircraft': 150},
+}
+
+# --- קידוד DF17 ---
+def cpr_nl(lat):
+    if abs(lat) >= 87: return 1
+    a = 1 - math.cos(math.pi / 30)
+    b = math.cos(math.pi / 180 * abs(lat)) ** 2
+    return int(math.floor(2 * math.pi / math.acos(1 - a / b)))
+
+def cpr_encode(lat, lon, odd):
+    dlat = 360.0 / (59 if odd else 60)
+    yz = math.floor(131072 * (lat % dlat) / dlat + 0.5)
+    rlat = dlat * (yz / 131072 + math.floor(lat / dlat))
+    dlon = 360.0 / max(cpr_nl(rlat) - odd, 1)
+    xz = math.floor(131072 * (lon % dlon) / dlon + 0.5)
+    return yz & 0x1FFFF, xz & 0x1FFFF
+
+def make_df17(icao, me):
+    frame = bytearray((17 << 3 | 5,)) + icao.to_bytes(3, 'big') + me.to_bytes(7, 'big') + bytes(3)
+    frame[11:] = CORE.modes_checksum(frame).to_bytes(3, 'big')
+    return bytes(frame)
+
+def me_identification(callsign):
+    me = 4 << 51
+    for i, c in enumerate(callsign.ljust(8)[:8]):
+        me |= (32 if c == ' ' else CHARS.index(c)) << (42 - 6 * i)
+    return me
+
+def me_position(lat, lon, alt_ft, odd):
+    n = int((alt_ft + 1000) / 25)
+    alt = ((n >> 4) << 5) | (1 << 4) | (n & 0xF)
+    yz, xz = cpr_encode(lat, lon, odd)
+    return (11 << 51) | (alt << 36) | (odd << 34) | (yz << 17) | xz
+
+def me_velocity(speed_kts, heading_deg):
+    v_ew = speed_kts * math.sin(math.radians(heading_deg))
+    v_ns = speed_kts * math.cos(math.radians(heading_deg))
+    ew = (int(v_ew < 0) << 10) | min(int(round(abs(v_ew))) + 1, 1023)
+    ns = (int(v_ns < 0) << 10) | min(int(round(abs(v_ns))) + 1, 1023)
+    return (19 << 51) | (1 << 48) | (ew << 32) | (ns << 21)
+
+def random_fleet(rng, count):
+    fleet = []
+    for _ in range(count):
+        dist, brg = rng.uniform(5, 150), rng.uniform(0, 2 * math.pi)
+        fleet.append({
+            'icao': int(rng.integers(0x400000, 0x800000)),
+            'cs': "".join(rng.choice(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"), 3)) + str(int(rng.integers(100, 9999))),
+            'lat': CORE.REF_LAT + dist / 111.0 * math.cos(brg),
+            'lon': CORE.REF_LON + dist / (111.0 * math.cos(math.radians(CORE.REF_LAT))) * math.sin(brg),
+            'alt': int(rng.integers(20, 400)) * 100,
+            'spd': float(rng.uniform(150, 480)),
+            'hdg': float(rng.uniform(0, 360)),
+        })
+    return fleet
+
+def random_frame(rng, plane):
+    kind = rng.integers(0, 4)
+    if kind == 0: me = me_identification(plane['cs'])
+    elif kind == 3: me = me_velocity(plane['spd'], plane['hdg'])
+    else: me = me_position(plane['lat'], plane['lon'], plane['alt'], int(kind == 2))
+    return make_df17(plane['icao'], me)
+
+# --- מחולל I/Q ---
+def generate(scenario, seconds, seed=1, noise=4.0):
+    # מחזיר (בתי I/Q uint8, [(דגימת התחלה, מסגרת)])
+    rng = np.random.default_rng(seed)
+    n = int(seconds * CORE.SAMPLE_RATE)
+    sig = rng.normal(0, noise, n).astype(np.float32) + 1j * rng.normal(0, noise, n).astype(np.float32)
+    fleet = random_fleet(rng, scenario['aircraft'])
+    amp_base = noise * math.sqrt(2) * 10 ** (scenario['snr_db'] / 20)
+
+    truth, pos = [], int(rng.integers(0, 400))
+    count = int(seconds * scenario['rate'])
+    gap = n / max(count, 1)
+    while pos + CORE.FRAME_SAMPLES < n and len(truth) < count:
+        frame = random_frame(rng, fleet[int(rng.integers(0, len(fleet)))])
+        bits = np.unpackbits(np.frombuffer(frame, dtype=np.uint8))
+        chips = np.zeros(CORE.FRAME_SAMPLES, dtype=np.float32)
+        chips[[0, 2, 7, 9]] = 1
+        chips[16 + 2 * np.arange(112) + (1 - bits)] = 1
+        amp = amp_base * 10 ** (rng.uniform(-3, 3) / 20)
+        f = rng.uniform(-1, 1) * scenario['freq_offset']
+        t = np.arange(CORE.FRAME_SAMPLES)
+        carrier = np.exp(1j * (2 * math.pi * f * t / CORE.SAMPLE_RATE + rng.uniform(0, 2 * math.pi)))
+        sig[pos:pos + CORE.FRAME_SAMPLES] += (amp * chips * carrier).astype(np.complex64)
+        truth.append((pos, frame))
+        if rng.random() < scenario['overlap']: pos += int(rng.integers(20, CORE.FRAME_SAMPLES))
+        else: pos += CORE.FRAME_SAMPLES + int(rng.exponential(max(gap - CORE.FRAME_SAMPLES, 1)))
+
+    iq = np.empty(2 * n, dtype=np.uint8)
+    iq[0::2] = np.clip(np.round(127.5 + sig.real), 0, 255)
+    iq[1::2] = np.clip(np.round(127.5 + sig.imag), 0, 255)
+    return iq, truth
+
+# --- הרצת השרשרת עם מדידת זמן לכל שלב ---
+# אותו מסלול כמו הלולאה הראשית של CORE.py (iq_to_mag -> decode_block -> handle_frame), והזמנים
+# נקראים מ-CORE.timings - כך שה-benchmark מודד את הקוד שרץ בפועל ולא עותק שלו.
+STAGES = CORE.STAGES[1:6]  # mag, detect, demod, crc, decode
+# תלויי מכונה - נשמרים ב-baseline רק עם --save-speed, ובלעדיהם ההשוואה היא על yield ו-false positives בלבד
+SPEED_KEYS = ('samples_per_sec', 'frames_per_sec', 'stage_ms', 'stage_samples_per_sec')
+
+def run_pipeline(iq, block_size=CORE.BLOCK_SIZE):
+    # מחזיר גם את המועמדים של הגלאי (מיקום מוחלט, בלי כפילויות מה-carry) לספירת false positives לפי שלב
+    decoded = []
+    candidates = set()
+    first = 0
+    detect = CORE.detect_preambles
+
+    def recording(mag, thresh):
+        offsets = detect(mag, thresh)
+        candidates.update((first + offsets).tolist())
+        return offsets
+
+    CORE.detect_preambles = recording
+    n = len(iq) // 2
+    mag_buf = np.empty(CORE.CARRY + block_size, dtype=np.uint16)
+    CORE.tracks.clear()
+    CORE.noise.reset()
+    CORE.dedup.clear()
+    for k in CORE.timings: CORE.timings[k] = 0.0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for start in range(0, n, block_size):
+                first = max(start - CORE.CARRY, 0)
+                raw = iq[2 * first:2 * min(start + block_size, n)]
+
+                t = time.perf_counter()
+                mag = CORE.iq_to_mag(raw, out=mag_buf[:len(raw) // 2])
+                CORE.timings['mag'] += time.perf_counter() - t
+                offsets, frames, rssi, addrs = CORE.decode_block(mag, CORE.tracks.tracks)
+                t = time.perf_counter()
+                for frame, r, addr in zip(frames, rssi, addrs): CORE.handle_frame(frame, float(r), int(addr))
+                CORE.timings['decode'] += time.perf_counter() - t
+
+                decoded += [(first + int(p), frame.tobytes()) for p, frame in zip(offsets, frames)]
+    finally:
+        CORE.detect_preambles = detect
+    return decoded, candidates, {k: CORE.timings[k] for k in STAGES}
+
+def score(scenario_name, seconds, seed, repeat=3):
+    # הזמנים: המינימום לכל שלב מתוך repeat הרצות (פחות רעש של המכונה)
+    iq, truth = generate(SCENARIOS[scenario_name], seconds, seed)
+    runs = []
+    for _ in range(repeat):
+        for k in CORE.stats: CORE.stats[k] = 0
+        runs.append(run_pipeline(iq))
+    decoded, candidates = runs[0][:2]
+    timers = {k: min(r[2][k] for r in runs) for k in STAGES}
+    sent = {(pos, frame) for pos, frame in truth}
+    hits = {d for d in decoded if d in sent or (d[0] - 1, d[1]) in sent or (d[0] + 1, d[1]) in sent}
+    starts = {pos for pos, _ in truth}
+    stray = sum(1 for p in candidates if not (p in starts or p - 1 in starts or p + 1 in starts))
+    total = sum(timers.values())
+    samples = len(iq) // 2
+    return {
+        'samples_per_sec': samples / total,
+        'frames_per_sec': len(decoded) / total,
+        'yield': len(hits) / max(len(truth), 1),
+        'false_positive_rate': (len(decoded) - len(hits)) / max(len(decoded), 1),
+        'frames_sent': len(truth),
+        'frames_decoded': len(decoded),
+        'crc_fixed': CORE.stats['crc_fixed1'] + CORE.stats['crc_fixed2'],
+        # false positives לפי שלב: מועמדים של הגלאי שלא נופלים על מסגרת אמיתית, ומה שה-CRC/AP דחה
+        'candidates': len(candidates),
+        'detect_false_positives': stray,
+        'crc_bad': CORE.stats['crc_bad'],
+        'ap_bad': CORE.stats['ap_bad'],
+        'stage_ms': {k: round(v * 1e3, 2) for k, v in timers.items()},
+        'stage_samples_per_sec': {k: samples / v if v > 0 else None for k, v in timers.items()},
+    }
+
+def compare(results, baseline, tolerance, speed_tolerance):
+    # רגרסיה: ירידה ב-yield, עלייה ב-false positives, או האטה מעבר לסף (רק אם ב-baseline יש מהירות)
+    failures = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b: continue
+        if r['yield'] < b['yield'] - tolerance:
+            failures.append(f"{name}: yield {r['yield']:.3f} < baseline {b['yield']:.3f}")
+        if r['false_positive_rate'] > b['false_positive_rate'] + tolerance:
+            failures.append(f"{name}: false positive rate {r['false_positive_rate']:.3f} > baseline {b['false_positive_rate']:.3f}")
+        if 'samples_per_sec' in b and r['samples_per_sec'] < b['samples_per_sec'] * (1 - speed_tolerance):
+            failures.append(f"{name}: {r['samples_per_sec'] / 1e6:.1f} MSPS < baseline {b['samples_per_sec'] / 1e6:.1f} MSPS")
+    return failures
+
+def check_aa_correction():
+    # ביט הפוך בשדה ה-AA של DF17 חייב לצאת מתוקן עם הכתובת המקורית (ולא ככתובת רפאים)
+    icao = 0x4840D6
+    good = make_df17(icao, me_identification("KLM1023"))
+    failures = []
+    for bit in range(8, 32):
+        bad = bytearray(good)
+        bad[bit >> 3] ^= 0x80 >> (bit & 7)
+        frames = np.frombuffer(bytes(bad), dtype=np.uint8).reshape(1, -1).copy()
+        _, fixed, addrs = CORE.validate_frames(np.zeros(1, dtype=np.int64), frames)
+        if len(fixed) != 1 or fixed[0].tobytes() != good or int(addrs[0]) != icao:
+            failures.append(f"AA bit {bit - 8}: " + (f"address {int(addrs[0]):06X}" if len(addrs) else "frame dropped"))
+    return failures
+
+# --- שרת מסגרות מדומה (stand-in למפענח קיים) ---
+# מסגרות DF17 מוכנות מראש (המטוסים זזים בין מסגרת למסגרת, כך שסינון הכפילויות לא מעלים אותן),
+# נשלחות לכל לקוח בקצב rate במנות של 10 ms.
+SERVE_TICK = 0.01
+
+def serve_frames(port, fmt, rate, seed, aircraft=200, distinct=50000):
+    rng = np.random.default_rng(seed)
+    fleet = random_fleet(rng, aircraft)
+    frames = []
+    for _ in range(distinct):
+        plane = fleet[int(rng.integers(0, len(fleet)))]
+        plane['lat'] += 2e-5 * math.cos(math.radians(plane['hdg']))
+        plane['lon'] += 2e-5 * math.sin(math.radians(plane['hdg']))
+        frames.append(random_frame(rng, plane))
+    signals = rng.integers(30, 220, len(frames)).tolist()
+
+    def stream(conn):
+        k, per_tick = 0, max(int(rate * SERVE_TICK), 1)
+        next_tick = time.perf_counter()
+        try:
+            while True:
+                ts = int(time.time() * 12e6)
+                if fmt == 'avr': chunk = b''.join(netio.avr_encode(frames[(k + i) % len(frames)]) for i in range(per_tick))
+                else: chunk = b''.join(netio.beast_encode(frames[(k + i) % len(frames)], ts, signals[(k + i) % len(frames)]) for i in range(per_tick))
+                conn.sendall(chunk)
+                k += per_tick
+                next_tick += SERVE_TICK
+                time.sleep(max(next_tick - time.perf_counter(), 0))
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    server = socket.create_server(("127.0.0.1", port))
+    print(f"📡 Serving {fmt} frames on 127.0.0.1:{port} at {rate:.0f} frames/s ({aircraft} aircraft)")
+    try:
+        while True:
+            conn, peer = server.accept()
+            print(f"🔌 Client {peer[0]}:{peer[1]}")
+            threading.Thread(target=stream, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Mode-S generator and DSP benchmark")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (default: all)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="signal length per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per scenario (best time per stage is kept)")
+    parser.add_argument("--threshold", type=float, default=CORE.THRESH_FACTOR, help="detection threshold factor (x local noise floor)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--save-speed", action="store_true", help="with --save-baseline, also store throughput (machine specific)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed absolute drop in yield / rise in false positive rate")
+    parser.add_argument("--speed-tolerance", type=float, default=0.25, help="allowed relative drop in samples/sec")
+    parser.add_argument("--write-iq", metavar="PATH", help="write the first scenario as a raw I/Q recording and exit")
+    parser.add_argument("--serve-frames", metavar="PORT", type=int, help="serve synthetic frames over TCP for CORE.py --ingest")
+    parser.add_argument("--format", choices=sorted(netio.PARSERS), default="beast", help="wire format for --serve-frames")
+    parser.add_argument("--rate", type=float, default=20000, help="frames per second for --serve-frames")
+    args = parser.parse_args()
+
+    if args.serve_frames:
+        serve_frames(args.serve_frames, args.format, args.rate, args.seed)
+        return
+
+    CORE.THRESH_FACTOR = args.threshold
+    names = args.scenario or list(SCENARIOS)
+
+    if args.write_iq:
+        iq, truth = generate(SCENARIOS[names[0]], args.seconds, args.seed)
+        iq.tofile(args.write_iq)
+        print(f"💾 {args.write_iq}: {len(iq) // 2 / CORE.SAMPLE_RATE:.1f} s, {len(truth)} frames ({names[0]})")
+        return
+
+    failures = check_aa_correction()
+    for msg in failures: print(f"❌ ERROR CORRECTION: {msg}")
+    if failures: sys.exit(1)
+
+    # חימום (הקצאות ראשונות של numpy) כדי שהתרחיש הראשון לא ייענש
+    run_pipeline(generate(SCENARIOS['clean'], 0.2, args.seed)[0])
+
+    results = {}
+    for name in names:
+        r = results[name] = score(name, args.seconds, args.seed, args.repeat)
+        print(f"🧪 {name:<6} | {r['samples_per_sec'] / 1e6:6.1f} MSPS | {r['frames_per_sec']:8.0f} frames/s | "
+              f"yield {r['yield'] * 100:5.1f}% | FP {r['false_positive_rate'] * 100:4.1f}% | "
+              f"{r['frames_decoded']}/{r['frames_sent']} frames, {r['crc_fixed']} fixed")
+        print(f"         detect {r['detect_false_positives']}/{r['candidates']} stray candidates | "
+              f"crc {r['crc_bad']} rejected | ap {r['ap_bad']} rejected")
+        print("         " + " | ".join(f"{k} {v:.1f} ms" for k, v in r['stage_ms'].items()))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f: baseline = json.load(f)
+        for name, r in results.items():
+            baseline[name] = r if args.save_speed else {k: v for k, v in r.items() if k not in SPEED_KEYS}
+        with open(args.baseline, 'w') as f: json.dump(baseline, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"❌ No baseline at {args.baseline} (run with --save-baseline first)")
+        sys.exit(1)
+    with open(args.baseline) as f: baseline = json.load(f)
+    failures = compare(results, baseline, args.tolerance, args.speed_tolerance)
+    for msg in failures: print(f"❌ REGRESSION: {msg}")
+    if failures: sys.exit(1)
+    print("✅ No regression against baseline.")
+
+if __name__ == "__main__":
+    main()
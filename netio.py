@@ -0,0 +1,238 @@
+import asyncio
+import queue
+import socket
+import threading
+import time
+
+# --- פורמטים סטנדרטיים של Mode-S ברשת (תואמי dump1090) ---
+# AVR (30002): "*<hex>;\n" לכל מסגרת.
+# SBS-1 / BaseStation (30003): שורות CSV של MSG,n עם השדות המפוענחים.
+# Beast (30005): 0x1a, סוג ('2' קצרה / '3' ארוכה), חותמת זמן 12 MHz (6 בתים), עוצמה (בית), המסגרת;
+# כל 0x1a בתוך הגוף מוכפל.
+AVR_PORT = 30002
+SBS_PORT = 30003
+BEAST_PORT = 30005
+PORTS = {'avr': AVR_PORT, 'sbs': SBS_PORT, 'beast': BEAST_PORT}
+
+BEAST_ESC = 0x1a
+BEAST_TYPES = {7: b'2', 14: b'3'}
+BEAST_LENGTHS = {0x31: 2, 0x32: 7, 0x33: 14}  # '1' Mode-A/C, '2' קצרה, '3' ארוכה
+
+def avr_encode(msg):
+    return b'*' + msg.hex().upper().encode() + b';\n'
+
+def beast_encode(msg, timestamp, signal):
+    body = (timestamp & 0xFFFFFFFFFFFF).to_bytes(6, 'big') + bytes((signal,)) + msg
+    return b'\x1a' + BEAST_TYPES[len(msg)] + body.replace(b'\x1a', b'\x1a\x1a')
+
+def sbs_encode(kind, icao, now, cs='', alt='', gs='', trk='', lat='', lon='', squawk=''):
+    # 22 שדות: MSG,סוג,session,aircraft,hex,flight,תאריך/שעה (יצירה ורישום),callsign,גובה,מהירות,כיוון,
+    # lat,lon,קצב אנכי,squawk,alert,emergency,spi,on-ground
+    t = time.localtime(now)
+    date = time.strftime('%Y/%m/%d', t)
+    tod = time.strftime('%H:%M:%S', t) + f'.{int(now % 1 * 1000):03d}'
+    return f"MSG,{kind},1,1,{icao},1,{date},{tod},{date},{tod},{cs},{alt},{gs},{trk},{lat},{lon},,{squawk},,,,\r\n".encode()
+
+# --- שרתי TCP ---
+# לולאת asyncio ב-thread משלה. הלולאה הראשית רק צוברת בתים לכל פורמט (emit) ומעבירה אותם
+# פעם אחת לכל בלוק (flush); הכתיבה לכל לקוח לא חוסמת, ולקוח שהבאפר שלו עבר MAX_CLIENT_BUFFER
+# מנותק - לקוח תקוע לא מאט את הפענוח ולא מנפח זיכרון.
+MAX_CLIENT_BUFFER = 256 * 1024
+MAX_CLIENTS = 64
+
+class Client(asyncio.Protocol):
+    def __init__(self, hub, name):
+        self.hub = hub
+        self.name = name
+        self.transport = None
+
+    def connection_made(self, transport):
+        clients = self.hub.clients[self.name]
+        if len(clients) >= MAX_CLIENTS:
+            transport.close()
+            return
+        self.transport = transport
+        clients.add(transport)
+        self.hub.active[self.name] = len(clients)
+
+    def connection_lost(self, exc):
+        clients = self.hub.clients[self.name]
+        clients.discard(self.transport)
+        self.hub.active[self.name] = len(clients)
+
+    def data_received(self, data):
+        pass
+
+class OutputHub:
+    def __init__(self, host='0.0.0.0', ports=PORTS):
+        self.host = host
+        self.ports = dict(ports)
+        self.clients = {name: set() for name in self.ports}
+        self.active = dict.fromkeys(self.ports, 0)  # נקרא מהלולאה הראשית בלי נעילה
+        self.pending = {name: [] for name in self.ports}
+        self.slow_disconnects = 0
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        if self.error: raise self.error
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.servers = [self.loop.run_until_complete(self.loop.create_server(lambda name=name: Client(self, name), self.host, port))
+                            for name, port in self.ports.items()]
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        self.loop.run_forever()
+        for server in self.servers: server.close()
+        for clients in self.clients.values():
+            for t in clients: t.abort()
+
+    def wants(self, name):
+        return self.active[name] > 0
+
+    def emit(self, name, data):
+        self.pending[name].append(data)
+
+    def flush(self):
+        for name, chunks in self.pending.items():
+            if not chunks: continue
+            self.loop.call_soon_threadsafe(self.write, name, b''.join(chunks))
+            chunks.clear()
+
+    def write(self, name, data):
+        # רץ בתוך לולאת ה-asyncio
+        for t in list(self.clients[name]):
+            if t.get_write_buffer_size() + len(data) > MAX_CLIENT_BUFFER:
+                t.abort()
+                self.slow_disconnects += 1
+            else:
+                t.write(data)
+
+    def stop(self):
+        if self.loop.is_running(): self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1.0)
+
+# --- קליטת מסגרות מהרשת (AVR / Beast) ---
+# מפענחי זרם: מקבלים בתים גולמיים מה-socket, מחזירים [(מסגרת, עוצמה 0-255)] ואת השארית שעוד לא הושלמה.
+def parse_avr(buf):
+    lines = buf.split(b'\n')
+    out = []
+    for line in lines[:-1]:
+        line = line.strip()
+        if line[:1] == b'*': line = line[1:]
+        elif line[:1] == b'@': line = line[13:]  # AVR עם חותמת זמן: '@' + 12 ספרות hex
+        else: continue
+        try: msg = bytes.fromhex(line.rstrip(b';').decode('ascii'))
+        except ValueError: continue
+        if len(msg) in (7, 14): out.append((msg, 0))
+    return out, lines[-1]
+
+def parse_beast(buf):
+    out = []
+    i, n = 0, len(buf)
+    while True:
+        i = buf.find(b'\x1a', i)
+        if i < 0 or i + 2 > n: return out, buf[i:] if i >= 0 else b''
+        size = BEAST_LENGTHS.get(buf[i + 1])
+        if size is None:
+            i += 1
+            continue
+        need = 7 + size  # חותמת זמן, עוצמה, מסגרת
+        body = buf[i + 2:i + 2 + need]
+        if b'\x1a' not in body:
+            if len(body) < need: return out, buf[i:]
+            end = i + 2 + need
+        else:
+            # נתיב איטי: ביטול הכפלות 0x1a
+            body, j = bytearray(), i + 2
+            while len(body) < need and j < n:
+                if buf[j] == BEAST_ESC:
+                    if j + 1 >= n: break
+                    if buf[j + 1] != BEAST_ESC: break  # תחילת הודעה חדשה - ההודעה הנוכחית פגומה
+                    j += 1
+                body.append(buf[j])
+                j += 1
+            if len(body) < need:
+                if j >= n - 1: return out, buf[i:]
+                i = j
+                continue
+            body, end = bytes(body), j
+        if size != 2: out.append((body[7:], body[6]))
+        i = end
+
+PARSERS = {'avr': parse_avr, 'beast': parse_beast}
+INGEST_QUEUE = 1024
+RECONNECT_DELAY = 2.0
+
+class FrameIngest:
+    # thread לכל מקלט מרוחק; כל recv הופך לאצווה אחת בתור ready. תור מלא = האצווה נזרקת (overruns)
+    # המונים משותפים לכל ה-threads - מתעדכנים תחת lock
+    def __init__(self, endpoints, fmt='beast'):
+        self.endpoints = endpoints
+        self.parse = PARSERS[fmt]
+        self.ready = queue.Queue(maxsize=INGEST_QUEUE)
+        self.overruns = 0
+        self.frames = 0
+        self.error = None
+        self.connected = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.running = True
+        self.threads = [threading.Thread(target=self.run, args=(host, port), daemon=True) for host, port in endpoints]
+
+    def start(self):
+        for t in self.threads: t.start()
+
+    def is_alive(self):
+        return any(t.is_alive() for t in self.threads)
+
+    def get(self, timeout=None):
+        return self.ready.get(timeout=timeout)
+
+    def run(self, host, port):
+        while self.running:
+            try:
+                conn = socket.create_connection((host, port), timeout=5)
+            except OSError as e:
+                print(f"⚠️ Ingest {host}:{port}: {e}")
+                self.stopped.wait(RECONNECT_DELAY)
+                continue
+            print(f"🔌 Ingest connected to {host}:{port}")
+            with self.lock: self.connected += 1
+            conn.settimeout(1.0)
+            rest = b''
+            try:
+                while self.running:
+                    try: data = conn.recv(65536)
+                    except socket.timeout: continue
+                    if not data: break
+                    batch, rest = self.parse(rest + data)
+                    if not batch: continue
+                    try:
+                        self.ready.put_nowait(batch)
+                        with self.lock: self.frames += len(batch)
+                    except queue.Full:
+                        with self.lock: self.overruns += 1
+            except OSError as e:
+                print(f"⚠️ Ingest {host}:{port}: {e}")
+            finally:
+                conn.close()
+                with self.lock: self.connected -= 1
+            if self.running: self.stopped.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        # recv חוזר תוך שנייה (timeout), create_connection תוך 5
+        self.running = False
+        self.stopped.set()
+        deadline = time.time() + 6.0
+        for t in self.threads:
+            if t.is_alive(): t.join(timeout=max(deadline - time.time(), 0))
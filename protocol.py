@@ -0,0 +1,123 @@
+import struct
+import time
+
+# --- פרוטוקול בינארי CORE -> MAIN ---
+# כל datagram: כותרת קבועה + רשומות בגודל קבוע, רשומה לכל מטוס.
+# deltas: רק מטוסים שהשתנו, ובכל רשומה mask של השדות שהשתנו מאז השידור הקודם.
+# snapshot: כל המטוסים עם מיקום, כל השדות - פעם ב-SNAPSHOT_INTERVAL שניות, כדי שמקלט
+# שפספס datagram (או שעלה באמצע) יתיישר. הודעה גדולה מחולקת ל-chunks שכל אחד עומד בפני עצמו,
+# כך שאובדן datagram אחד מאבד רק את הרשומות שבו.
+# ה-mask של delta מכסה את כל השדות שהשתנו מאז ה-snapshot האחרון (לא רק מאז השידור הקודם) - הרשומה
+# בגודל קבוע ממילא, כך שזה לא עולה בתים, ו-delta שאבד מתוקן בעדכון הבא של אותו מטוס. מטוס שלא
+# משתנה יותר אחרי delta שאבד נשאר מיושן עד ה-snapshot הבא, לכל היותר SNAPSHOT_INTERVAL.
+MAGIC = b'AB'
+VERSION = 1
+KIND_DELTA = 0
+KIND_SNAPSHOT = 1
+
+# magic, version, kind, seq, chunk, chunks, records, זמן שידור
+HEADER = struct.Struct('<2sBBIBBHd')
+# addr, mask, cs, alt (m), spd (km/h), hdg, lat, lon, rssi, squawk, msgs
+RECORD = struct.Struct('<IH8siHHddf4sI')
+FIELDS = ('cs', 'alt', 'spd', 'hdg', 'lat', 'lon', 'rssi', 'squawk', 'msgs')
+FULL_MASK = (1 << len(FIELDS)) - 1
+
+MAX_DATAGRAM = 1400  # מתחת ל-MTU של Ethernet
+RECORDS_PER_CHUNK = (MAX_DATAGRAM - HEADER.size) // RECORD.size
+SNAPSHOT_INTERVAL = 10.0
+
+def track_values(ac):
+    return (ac.cs, ac.alt, ac.spd, ac.hdg, ac.lat, ac.lon, ac.rssi, ac.squawk, ac.msgs)
+
+class Encoder:
+    def __init__(self, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.seq = 0
+        self.sent = {}  # addr -> הערכים שנשלחו לאחרונה
+        self.base = {}  # addr -> הערכים ב-snapshot האחרון (או בשליחה המלאה הראשונה)
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = 0.0
+
+    def snapshot_due(self, now):
+        return now - self.last_snapshot >= self.snapshot_interval
+
+    def encode(self, tracks, snapshot=False, now=None):
+        # tracks: רשומות Track עם מיקום. מחזיר רשימת datagrams (אולי ריקה)
+        now = time.time() if now is None else now
+        records = []
+        for ac in tracks:
+            values = track_values(ac)
+            old = self.sent.get(ac.addr)
+            if snapshot or old is None:
+                mask = FULL_MASK
+                self.base[ac.addr] = values
+            elif values == old: continue
+            else: mask = sum(1 << i for i, (a, b) in enumerate(zip(values, self.base[ac.addr])) if a != b)
+            self.sent[ac.addr] = values
+            if values[7] is None: mask &= ~(1 << 7)
+            cs, alt, spd, hdg, lat, lon, rssi, squawk, msgs = values
+            records.append(RECORD.pack(ac.addr, mask, cs.encode('ascii', 'replace')[:8], int(alt), int(spd) & 0xFFFF, int(hdg) % 360,
+                                       lat, lon, rssi, (squawk or '').encode('ascii')[:4], msgs & 0xFFFFFFFF))
+        if snapshot: self.last_snapshot = now
+        if not records and not snapshot: return []
+
+        kind = KIND_SNAPSHOT if snapshot else KIND_DELTA
+        chunks = [records[i:i + RECORDS_PER_CHUNK] for i in range(0, len(records), RECORDS_PER_CHUNK)] or [[]]
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return [HEADER.pack(MAGIC, VERSION, kind, self.seq, k, len(chunks), len(chunk), now) + b''.join(chunk)
+                for k, chunk in enumerate(chunks)]
+
+    def forget(self, addrs):
+        # מטוסים שפגו, או ששליחתם נכשלה - הפעם הבאה תישלח שוב במלואה
+        for a in addrs:
+            self.sent.pop(a, None)
+            self.base.pop(a, None)
+
+class Decoder:
+    def __init__(self):
+        self.planes = {}  # icao -> dict בפורמט של to_dict
+        self.seq = None
+        self.lost = 0      # datagrams שחסרו: chunks שלא הגיעו מהודעה, והודעות שלמות שחסרו לפי seq
+        self.chunks = 0    # כמה chunks בהודעה הנוכחית
+        self.seen = set()  # אילו chunks של ההודעה הנוכחית הגיעו
+        self.bad = 0       # datagrams עם magic/version/אורך לא תקינים
+        self.snapshots = 0
+        self.last_sent = None  # זמן השליחה של ה-datagram האחרון (שעון השולח)
+
+    def feed(self, data):
+        # מחזיר את רשימת ה-ICAO שעודכנו מה-datagram הזה
+        if len(data) < HEADER.size: self.bad += 1; return []
+        magic, version, kind, seq, chunk, chunks, count, sent = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or len(data) != HEADER.size + count * RECORD.size:
+            self.bad += 1
+            return []
+        if seq != self.seq:
+            if self.seq is not None:
+                self.lost += self.chunks - len(self.seen)
+                gap = (seq - self.seq - 1) & 0xFFFFFFFF
+                if gap < 0x80000000: self.lost += gap  # מספר ה-chunks בהודעה שאבדה כולה לא ידוע - נספרת כאחד
+            self.seq = seq
+            self.chunks = chunks
+            self.seen = set()
+            if kind == KIND_SNAPSHOT: self.snapshots += 1
+        self.seen.add(chunk)
+        self.last_sent = sent
+
+        updated = []
+        for off in range(HEADER.size, len(data), RECORD.size):
+            addr, mask, cs, alt, spd, hdg, lat, lon, rssi, squawk, msgs = RECORD.unpack_from(data, off)
+            icao = format(addr, '06X')
+            p = self.planes.get(icao)
+            if p is None:
+                p = self.planes[icao] = {'icao': icao, 'cs': '?', 'alt': 0, 'spd': 0, 'hdg': 0, 'lat': None, 'lon': None,
+                                         'rssi': 0.0, 'squawk': None, 'msgs': 0}
+            values = (cs.rstrip(b'\x00').decode('ascii', 'replace'), alt, spd, hdg, lat, lon, rssi,
+                      squawk.rstrip(b'\x00').decode('ascii', 'replace') or None, msgs)
+            for i, name in enumerate(FIELDS):
+                if mask >> i & 1: p[name] = values[i]
+            p['last'] = sent
+            updated.append(icao)
+        return updated
+
+    def expire(self, now, timeout=60):
+        # מטוסים שלא הגיע עליהם עדכון timeout שניות (לפי שעון השולח)
+        for icao in [k for k, p in self.planes.items() if now - p['last'] > timeout]: del self.planes[icao]
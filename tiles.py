@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# ==============================================================================
+# 🗺️ OFFLINE MAP TILES
+# ==============================================================================
+# מאגר אריחים מקומי ב-SQLite, באותה סכמה ש-tkintermapview קורא (database_path) ושה-OfflineLoader שלו כותב:
+# tiles(zoom, x, y, server, tile_image). האריחים נשמרים תחת כתובת שרת האריחים של MAIN.py, כך שהמפה
+# מוצאת אותם גם כשהם נטענו ממקור אחר (תיקייה מקומית או שרת HTTP מקומי).
+# python3 tiles.py                                -> הורדת האזור סביב REF_LAT/REF_LON (רדיוס ורמות זום ברירת מחדל)
+# python3 tiles.py --radius 50 --zoom 8-14        -> אזור ורמות זום אחרים
+# python3 tiles.py --source ./tiles/{z}/{x}/{y}.png -> טעינה מתיקיית אריחים מקומית במקום מהרשת
+# python3 tiles.py --stats                        -> כמה אריחים יש במאגר לכל זום
+import os
+import sys
+import math
+import sqlite3
+import argparse
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+import requests
+
+TILE_DB = "tiles.db"
+TILE_SERVER = "https://mt0.google.com/vt/lyrs=m&hl=he&x={x}&y={y}&z={z}&s=Ga"
+REF_LAT = 31.999
+REF_LON = 34.946
+PREFETCH_RADIUS_KM = 150  # כמו MAX_RANGE_KM ב-MAIN.py
+PREFETCH_ZOOM = (6, 12)
+PREFETCH_WORKERS = 8
+# Tk מחזיק כל PhotoImage של 256x256 כ-RGBA מלא, ~256KB לאריח: 512 אריחים ~ 128MB בתקרה.
+# מספיק לתצוגה (~30 אריחים) ולטבעת ה-pre_cache של tkintermapview סביבה (עד 17x17) עם מקום לחזרה אחורה.
+TILE_CACHE_SIZE = 512
+
+# --- מתמטיקת אריחים (Web Mercator, כמו decimal_to_osm של tkintermapview) ---
+def tile_xy(lat, lon, zoom):
+    n = 2 ** zoom
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+    return min(int(x), n - 1), min(int(y), n - 1)
+
+def bbox_around(lat, lon, radius_km):
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * math.cos(math.radians(lat)))
+    return lat + dlat, lon - dlon, lat - dlat, lon + dlon  # צפון-מערב, דרום-מזרח
+
+def tiles_in_bbox(bbox, zooms):
+    north, west, south, east = bbox
+    for z in zooms:
+        x0, y0 = tile_xy(north, west, z)
+        x1, y1 = tile_xy(south, east, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+# --- המאגר ---
+class TileStore:
+    def __init__(self, path=TILE_DB, server=TILE_SERVER):
+        self.path = path
+        self.server = server
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS server (
+                url VARCHAR(300) PRIMARY KEY NOT NULL,
+                max_zoom INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                server VARCHAR(300) NOT NULL,
+                tile_image BLOB NOT NULL,
+                CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+                CONSTRAINT pk_tiles PRIMARY KEY (zoom, x, y, server));""")
+        self.db.execute("INSERT OR IGNORE INTO server (url, max_zoom) VALUES (?, ?);", (server, 19))
+        self.db.commit()
+
+    def has(self, zoom, x, y):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?;",
+                                   (zoom, x, y, self.server)).fetchone() is not None
+
+    def get(self, zoom, x, y):
+        with self.lock:
+            row = self.db.execute("SELECT tile_image FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?;",
+                                  (zoom, x, y, self.server)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, rows):
+        # rows: [(zoom, x, y, png)] - טרנזקציה אחת לכל אצווה
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO tiles (zoom, x, y, server, tile_image) VALUES (?, ?, ?, ?, ?);",
+                                [(z, x, y, self.server, data) for z, x, y, data in rows])
+            self.db.commit()
+
+    def counts(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT zoom, COUNT(*) FROM tiles WHERE server=? GROUP BY zoom ORDER BY zoom;",
+                                        (self.server,)).fetchall())
+
+    def close(self):
+        self.db.close()
+
+def fetch_tile(source, zoom, x, y, session=None):
+    # source: תבנית URL ({z}/{x}/{y}) או תבנית נתיב בתיקייה מקומית. מחזיר את הבתים או None אם אין אריח
+    where = source.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+    if where.startswith(("http://", "https://")):
+        r = (session or requests).get(where, headers={"User-Agent": "ShohamRadar/11.0"}, timeout=10)
+        return r.content if r.status_code == 200 and r.content else None
+    try:
+        with open(where, "rb") as f: return f.read()
+    except FileNotFoundError:
+        return None
+
+def prefetch(store, bbox, zooms, source=None, workers=PREFETCH_WORKERS, batch=200, progress=None):
+    # מוריד למאגר את כל האריחים בתיבה שעוד חסרים בו; מחזיר (הורדו, היו כבר, נכשלו)
+    source = source or store.server
+    todo = [t for t in tiles_in_bbox(bbox, zooms) if not store.has(*t)]
+    have = sum(1 for _ in tiles_in_bbox(bbox, zooms)) - len(todo)
+    done = failed = 0
+    rows = []
+    session = requests.Session()
+
+    def job(t):
+        try: return t, fetch_tile(source, *t, session=session)
+        except requests.RequestException: return t, None
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for (z, x, y), data in pool.map(job, todo):
+            if data is None:
+                failed += 1
+                continue
+            rows.append((z, x, y, data))
+            done += 1
+            if len(rows) >= batch:
+                store.put_many(rows)
+                rows.clear()
+                if progress: progress(done + failed, len(todo))
+    if rows: store.put_many(rows)
+    if progress: progress(done + failed, len(todo))
+    return done, have, failed
+
+# --- מטמון התמונות המפוענחות בזיכרון ---
+class TileLRU(OrderedDict):
+    # מחליף את map_widget.tile_image_cache (dict לפי f"{zoom}{x}{y}" -> PhotoImage). כל גישה מזיזה את
+    # האריח לסוף, ומעבר ל-capacity נזרק הוותיק ביותר. נעילה: thread ה-pre_cache של tkintermapview כותב
+    # במקביל ל-thread של Tk, ויכול לזרוק אריח בין בדיקת `in` לקריאה - לכן הקריאה מה-Tk עוברת דרך get
+    # (בדיקה וקריאה תחת אותה נעילה, ראו install).
+    def __init__(self, capacity=TILE_CACHE_SIZE):
+        super().__init__()
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.evictions = 0
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            if not super().__contains__(key): return default
+            return self[key]
+
+    def __contains__(self, key):
+        with self.lock: return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.capacity:
+                self.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self.lock: super().__delitem__(key)
+
+def install(map_widget, capacity=TILE_CACHE_SIZE):
+    # לקרוא אחרי set_tile_server - הוא יוצר tile_image_cache חדש.
+    # get_tile_image_from_cache המקורי עושה `in` ואז [] - שתי נעילות נפרדות; מוחלף בקריאה אחת ל-get.
+    cache = TileLRU(capacity)
+    cache.update(map_widget.tile_image_cache)
+    map_widget.tile_image_cache = cache
+
+    def get_tile_image_from_cache(zoom, x, y):
+        image = cache.get(f"{zoom}{x}{y}")
+        return False if image is None else image
+
+    map_widget.get_tile_image_from_cache = get_tile_image_from_cache
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline map tile store")
+    parser.add_argument("--db", default=TILE_DB)
+    parser.add_argument("--server", default=TILE_SERVER, help="Tile URL the map uses (tiles are stored under it)")
+    parser.add_argument("--source", default=None, help="Fetch from this URL or local {z}/{x}/{y} path template instead of --server")
+    parser.add_argument("--lat", type=float, default=REF_LAT)
+    parser.add_argument("--lon", type=float, default=REF_LON)
+    parser.add_argument("--radius", type=float, default=PREFETCH_RADIUS_KM, help="km around --lat/--lon")
+    parser.add_argument("--zoom", default=f"{PREFETCH_ZOOM[0]}-{PREFETCH_ZOOM[1]}", help="zoom range, e.g. 6-12")
+    parser.add_argument("--workers", type=int, default=PREFETCH_WORKERS)
+    parser.add_argument("--stats", action="store_true", help="Print tile counts per zoom and exit")
+    args = parser.parse_args()
+
+    store = TileStore(args.db, args.server)
+    if args.stats:
+        for z, n in store.counts().items(): print(f"z{z:<3} {n:>7} tiles")
+        print(f"💾 {os.path.getsize(args.db) / 1e6:.1f} MB")
+        return
+
+    lo, _, hi = args.zoom.partition("-")
+    zooms = range(int(lo), int(hi or lo) + 1)
+    bbox = bbox_around(args.lat, args.lon, args.radius)
+    total = sum(1 for _ in tiles_in_bbox(bbox, zooms))
+    print(f"🗺️ {total} tiles, zoom {zooms.start}-{zooms.stop - 1}, {args.radius:.0f} km around {args.lat:.3f},{args.lon:.3f}")
+
+    def progress(n, of):
+        sys.stdout.write(f"\r⬇️ {n}/{of}")
+        sys.stdout.flush()
+
+    done, have, failed = prefetch(store, bbox, zooms, args.source, args.workers, progress=progress)
+    print(f"\n✅ {done} downloaded, {have} already stored, {failed} failed")
+    store.close()
+
+if __name__ == "__main__":
+    main()